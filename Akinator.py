@@ -1,9 +1,13 @@
 from random import SystemRandom
+from collections import OrderedDict
 from file_skeleton import Layouts
-from sqlite3 import Cursor
 from enum import IntEnum
 from ConnectionClass import Connection
+from EngineClass import GameEngine
+from ShardClass import ShardPool, ShardedGame
+from file_management import PathCreator, FileManager
 from VersionClass import Version
+import numpy as np
 
 
 # Class for easier update management
@@ -48,6 +52,43 @@ class AkinationAlgorithms():
     bad_answer_weight: float = 0.8
     no_answer_constant: float = -0.2
 
+    # definite yes or no answers remove entities with definite opposite answers instead of only lowering ratings
+    # off by default: a single wrong answer of user can not be recovered from
+    prune_contradictions: bool = False
+
+    # poll answers in order of rating increase table columns
+    given_answer_values: tuple = (1.0, 0.5, 0.0, -0.5, -1.0)
+    # dict[tuple, np.ndarray] as tables for sets of true answer values
+    __increase_tables__: dict = dict()
+
+    # scoring algorithms of themes: dict[str, class] as AkinationAlgorithms or BayesianAlgorithms for theme
+    theme_algorithms: dict = dict()
+    # names of scoring algorithms in theme config
+    algorithm_names: tuple = ("akination", "bayesian")
+
+    @staticmethod
+    def of_theme(theme: str):
+        # "algorithms" of theme config is read once per process, themes without it are scored by this class
+        algorithms = AkinationAlgorithms.theme_algorithms.get(theme)
+        if algorithms is None:
+            try:
+                config = FileManager.get_json(PathCreator.theme_config(theme), create_if_not_exists=False)
+            except FileManager.Error:
+                config = dict()
+            # unknown names raise ValueError
+            name = config.get("algorithms", AkinationAlgorithms.algorithm_names[0])
+            algorithms = (AkinationAlgorithms, BayesianAlgorithms)[AkinationAlgorithms.algorithm_names.index(name)]
+            AkinationAlgorithms.theme_algorithms[theme] = algorithms
+        return algorithms
+
+    @staticmethod
+    def compute_threshold(game_class, maximum: float, minimum: float, guess_threshold: float) -> float:
+        return game_class.get_compute_threshold(maximum, minimum, guess_threshold)
+
+    @staticmethod
+    def leader_is_good(db, leader_rating: float, next_rating: float, difference: float) -> bool:
+        return leader_rating - next_rating >= difference
+
     @staticmethod
     def answers_to_question_count(db: Connection) -> list:  # list[tuple[id, float]]
         return db.execute("SELECT question_id COUNT(question_id) as c FROM answers "
@@ -76,26 +117,69 @@ class AkinationAlgorithms():
         else: # tmp < 0  == diff signs
             return (abs(abs(true_answer) - abs(given_answer)) - 1.0) * AkinationAlgorithms.bad_answer_weight
 
-    @staticmethod  # no way to optimise
+    @staticmethod
+    def rating_increase_table(true_answers: np.ndarray) -> np.ndarray:
+        # table[i, j] == get_rating_increase(true_answers[i], given_answer_values[j])
+        key = (AkinationAlgorithms.good_answer_weight, AkinationAlgorithms.bad_answer_weight,
+               AkinationAlgorithms.no_answer_constant) + tuple(true_answers.tolist())
+        table = AkinationAlgorithms.__increase_tables__.get(key)
+
+        if table is None:
+            table = np.array([[AkinationAlgorithms.get_rating_increase(true_answer, given_answer)
+                               for given_answer in AkinationAlgorithms.given_answer_values]
+                              for true_answer in true_answers.tolist()], dtype=np.float64).reshape(-1, 5)
+            table.flags.writeable = False
+            AkinationAlgorithms.__increase_tables__[key] = table
+
+        return table
+
+    @staticmethod
+    def rating_increase_column(true_answers: np.ndarray, given_answer: float) -> np.ndarray:
+        if given_answer in AkinationAlgorithms.given_answer_values:
+            return AkinationAlgorithms.rating_increase_table(true_answers)[
+                :, AkinationAlgorithms.given_answer_values.index(given_answer)]
+
+        return np.array([AkinationAlgorithms.get_rating_increase(true_answer, given_answer)
+                         for true_answer in true_answers.tolist()], dtype=np.float64)
+
+    @staticmethod
     def get_rating_increasemany(true_answers: list, given_answers: list) -> float:
         # true answers and given answers are of different size !!! => zip cannot be used
+        # first true answer to a question is used
+        true_answers_ = dict()
+        for question_id, answer_value in true_answers:
+            true_answers_.setdefault(question_id, answer_value)
 
         increase = 0.0
 
-        for given_answer in given_answers:
-            for true_answer in true_answers:
-                if given_answer[0] == true_answer[0]: # same question id
-                    increase += AkinationAlgorithms.get_rating_increase(true_answer[1], given_answer[1])
-                    break
+        for question_id, answer_value in given_answers:
+            if question_id in true_answers_:
+                increase += AkinationAlgorithms.get_rating_increase(true_answers_[question_id], answer_value)
 
         return increase
 
     @staticmethod
-    def increase_rating(db: Connection, last_answer: GivenAnswer, threshold: float):
+    def increase_rating(db, last_answer: GivenAnswer, threshold: float):  # db is GameEngine or Connection
         # no longer # user answer is not helpful
         #if last_answer.answer_value == 0.0:
         #    return
 
+        if isinstance(db, ShardedGame):
+            db.increase_rating(AkinationAlgorithms, last_answer.question_id, last_answer.answer_value, threshold)
+            return
+
+        if isinstance(db, GameEngine):
+            if AkinationAlgorithms.prune_contradictions:
+                db.prune_contradicting(last_answer.question_id, last_answer.answer_value)
+
+            entities, answer_codes = db.entities_answering_question(last_answer.question_id)
+            selected = db.ratings[entities] >= threshold
+            if AkinationAlgorithms.prune_contradictions:
+                selected &= db.entities_active(entities)
+            increases = AkinationAlgorithms.rating_increase_column(db.answer_levels(), last_answer.answer_value)
+            db.increase_ratings(entities[selected], increases[answer_codes[selected]])
+            return
+
         entities = db.entities_answering_question(last_answer.question_id).fetchall()
 
         ids, ratings, answer_values = [e[0] for e in entities], [e[2] for e in entities], [e[1] for e in entities]
@@ -115,7 +199,34 @@ class AkinationAlgorithms():
         db.update_entity_ratings(new_values)
 
     @staticmethod
-    def increasemany_rating(db: Connection, given_answers: list):  # list[tuple[int, float]]
+    def increasemany_rating(db, given_answers: list):  # list[tuple[int, float]], db is GameEngine or Connection
+        if isinstance(db, ShardedGame):
+            db.increasemany_rating(AkinationAlgorithms, given_answers)
+            return
+
+        if isinstance(db, GameEngine):
+            if not given_answers:
+                return
+
+            if AkinationAlgorithms.prune_contradictions:
+                for question_id, answer_value in given_answers:
+                    db.prune_contradicting(question_id, answer_value)
+
+            # table[true answer code, given answer index] gathered for all answers to given questions at once
+            table = np.stack([AkinationAlgorithms.rating_increase_column(db.answer_levels(), answer_value)
+                              for question_id, answer_value in given_answers], axis=1)
+            answers = [db.entities_answering_question(question_id) for question_id, answer_value in given_answers]
+            entities = np.concatenate([answer[0] for answer in answers])
+            answer_codes = np.concatenate([answer[1] for answer in answers])
+            given_indexes = np.repeat(np.arange(len(answers)), [len(answer[0]) for answer in answers])
+
+            # sums in order of given answers same as get_rating_increasemany
+            increases = np.bincount(entities, weights=table[answer_codes, given_indexes], minlength=len(db.ratings))
+
+            updated = np.flatnonzero(~db.entity_used & (increases != 0.0))
+            db.increase_ratings(updated, increases[updated])
+            return
+
         entities = db.entities_answering_many_questions([str(id) for id, value in given_answers])
 
         new_values = list()  # list[tuple[float, int]] as list of pairs (rating and id)
@@ -131,12 +242,268 @@ class AkinationAlgorithms():
         db.update_entity_ratings(new_values)
 
     @staticmethod
-    def best_question(db: Connection, threshold: float) -> Cursor:
-        return db.question_ratings(threshold)
+    def information_gains(yes: np.ndarray, no: np.ndarray, candidate_count: int) -> np.ndarray:
+        # entropy of splitting equally probable candidates into yes, no and unknown answers
+        gains = np.zeros(len(yes), dtype=np.float64)
+        splitting = np.flatnonzero(yes + no)
+        if len(splitting) == 0:
+            return gains
+
+        split = np.stack((yes[splitting], no[splitting], candidate_count - yes[splitting] - no[splitting]))
+        split = split / candidate_count
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gains[splitting] = -np.where(split > 0.0, split * np.log2(split), 0.0).sum(axis=0)
+        return gains
+
+    @staticmethod
+    def best_question(db, threshold: float) -> list:  # list[tuple[id]]
+        if isinstance(db, (GameEngine, ShardedGame)):
+            # same questions as by answer count, best split of candidates first, answer count on ties
+            # counts of sharded games are summed over shards
+            counts = db.question_counts(threshold)
+            splits = db.question_splits(threshold)
+            if isinstance(db, GameEngine) and splits[2] == db.matrix.entity_count():
+                # all entities are candidates: gains are the entropies computed when the version was published
+                gains = db.matrix.question_entropies.copy()
+            else:
+                gains = AkinationAlgorithms.information_gains(*splits)
+            # questions correlated with asked ones tell little new
+            redundancy = db.question_redundancy()
+            if redundancy is not None:
+                gains *= 1.0 - redundancy
+            questions = np.flatnonzero(~db.question_used & (counts >= 1))
+            return db.question_ids(questions[np.lexsort((-counts[questions], -gains[questions]))])
+        return db.question_ratings(threshold).fetchall()
+
+    @staticmethod
+    def best_character(db, threshold: float, count: int = None) -> list:  # list[tuple[id, rating]]
+        # count best entities or all of them
+        if isinstance(db, (GameEngine, ShardedGame)):
+            return db.entity_ratings(threshold, count)
+        if count is not None:
+            return db.entity_ratings(threshold).fetchmany(max(count, 0))
+        return db.entity_ratings(threshold).fetchall()
+
+
+# Ratings as log posterior probabilities of entities: base ratings are log prior and every answer adds the log
+# likelihood ratio of the given answer for the true one against an entity without answer to the question
+# Same API as AkinationAlgorithms for GameEngine games, selected with "algorithms": "bayesian" in theme config
+class BayesianAlgorithms():
+    # likelihood of given answer falls with its distance to true one, any answer is given with answer_noise
+    answer_sharpness: float = 4.0
+    answer_noise: float = 0.02
+    # entities less probable than leader by this log ratio are not candidates
+    candidate_log_ratio: float = 6.9
+    # leader is guessed when its posterior probability is at least guess_probability
+    guess_probability: float = 0.2
+
+    # dict[tuple, np.ndarray] as tables for sets of true answer values
+    __increase_tables__: dict = dict()
+
+    @staticmethod
+    def rating_increase_table(true_answers: np.ndarray) -> np.ndarray:
+        # table[i, j] == log P(given_answer_values[j] | true_answers[i]) - log P(given_answer_values[j] | unknown)
+        key = (BayesianAlgorithms.answer_sharpness, BayesianAlgorithms.answer_noise) + tuple(true_answers.tolist())
+        table = BayesianAlgorithms.__increase_tables__.get(key)
+
+        if table is None:
+            given = np.array(AkinationAlgorithms.given_answer_values)
+            # "I do not know" tells nothing about the entity
+            informative = given != 0.0
+            likelihoods = np.exp(-BayesianAlgorithms.answer_sharpness *
+                                 np.abs(true_answers.reshape(-1, 1) - given[informative]))
+            likelihoods /= likelihoods.sum(axis=1, keepdims=True)
+            likelihoods = (1.0 - BayesianAlgorithms.answer_noise) * likelihoods + \
+                BayesianAlgorithms.answer_noise / informative.sum()
+
+            table = np.zeros((len(true_answers), len(given)), dtype=np.float64)
+            table[:, informative] = np.log(likelihoods * informative.sum())
+            table[true_answers == 0.0] = 0.0
+            table.flags.writeable = False
+            BayesianAlgorithms.__increase_tables__[key] = table
+
+        return table
+
+    @staticmethod
+    def rating_increase_column(true_answers: np.ndarray, given_answer: float) -> np.ndarray:
+        return BayesianAlgorithms.rating_increase_table(true_answers)[
+            :, AkinationAlgorithms.given_answer_values.index(given_answer)]
 
     @staticmethod
-    def best_character(db: Connection, threshold: float) -> Cursor:
-        return db.entity_ratings(threshold)
+    def increase_rating(db: GameEngine, last_answer: GivenAnswer, threshold: float):
+        # posterior is exact: all entities are updated whatever the threshold
+        BayesianAlgorithms.increasemany_rating(db, [(last_answer.question_id, last_answer.answer_value)])
+
+    @staticmethod
+    def increasemany_rating(db: GameEngine, given_answers: list):  # list[tuple[int, float]]
+        for question_id, answer_value in given_answers:
+            entities, answer_codes = db.entities_answering_question(question_id)
+            increases = BayesianAlgorithms.rating_increase_column(db.answer_levels(), answer_value)[answer_codes]
+            updated = ~db.entity_used[entities] & (increases != 0.0)
+            db.increase_ratings(entities[updated], increases[updated])
+
+    @staticmethod
+    def compute_threshold(game_class, maximum: float, minimum: float, guess_threshold: float) -> float:
+        return maximum - BayesianAlgorithms.candidate_log_ratio
+
+    @staticmethod
+    def leader_is_good(db: GameEngine, leader_rating: float, next_rating: float, difference: float) -> bool:
+        # posterior probability of leader among all unused entities
+        ratings = db.ratings[~db.entity_used & (db.ratings > GameEngine.wrong_guess_rating)]
+        return 1.0 / np.exp(ratings - leader_rating).sum() >= BayesianAlgorithms.guess_probability
+
+    @staticmethod
+    def best_question(db: GameEngine, threshold: float) -> list:  # list[tuple[id]]
+        # information gain of splitting candidates weighted by their posterior probabilities, answer count on ties
+        candidates = db.entities_over(threshold)
+        counts = db.question_counts(threshold)
+        questions = np.flatnonzero(~db.question_used & (counts >= 1))
+        if len(candidates) == 0:
+            return db.question_ids(questions[np.argsort(-counts[questions], kind="stable")])
+
+        probabilities = np.exp(db.ratings[candidates] - db.ratings[candidates].max())
+        lengths = db.matrix.entity_offsets[candidates + 1] - db.matrix.entity_offsets[candidates]
+        splits = np.bincount(db.matrix.entity_answer_splits[db.matrix.entity_answers(candidates)],
+                             weights=np.repeat(probabilities, lengths), minlength=3 * db.matrix.question_count())
+        gains = AkinationAlgorithms.information_gains(splits[2::3], splits[0::3], probabilities.sum())
+        redundancy = db.question_redundancy()
+        if redundancy is not None:
+            gains *= 1.0 - redundancy
+        return db.question_ids(questions[np.lexsort((-counts[questions], -gains[questions]))])
+
+    @staticmethod
+    def best_character(db: GameEngine, threshold: float, count: int = None) -> list:  # list[tuple[id, rating]]
+        return db.entity_ratings(threshold, count)
+
+
+# First questions of a theme version: every game starts from base ratings, so they only depend on given answers
+# Built when the version is published, games ask these questions without computing them
+class OpeningBook():
+    depth: int = 4
+
+    # loaded books: dict[tuple[str, str], OpeningBook]
+    __registry__: dict = dict()
+
+    def __init__(self, depth: int = 0, questions: dict = None):
+        self.depth = depth
+        # dict[str, dict[str, int]] as question id for game class name and answer history
+        self.questions = questions if questions is not None else dict()
+
+    @staticmethod
+    def key(given_answers: list) -> str:  # given_answers is list[tuple[int, float]]
+        return ",".join(f"{question_id}:{float(answer_value)}" for question_id, answer_value in given_answers)
+
+    @staticmethod
+    def get(theme: str, version: Version):
+        key = theme, version.to_string()
+        book = OpeningBook.__registry__.get(key)
+
+        if book is None:
+            try:
+                data = FileManager.get_json(PathCreator.opening_book(theme, version), create_if_not_exists=False)
+                book = OpeningBook(data["depth"], data["questions"])
+            except (FileManager.Error, KeyError):
+                # no book: all questions are computed
+                book = OpeningBook()
+            OpeningBook.__registry__[key] = book
+
+        return book
+
+    def save(self, theme: str, version: Version):
+        FileManager.write_json(PathCreator.opening_book(theme, version),
+                               {"depth": self.depth, "questions": self.questions})
+        OpeningBook.__registry__[theme, version.to_string()] = self
+
+    def question(self, game_class: str, given_answers: list) -> int:  # None past the depth of book
+        if given_answers is None or len(given_answers) >= self.depth:
+            return None
+        return self.questions.get(game_class, dict()).get(OpeningBook.key(given_answers))
+
+    @staticmethod
+    def build(theme: str, version: Version, game_classes: list, depth: int = None):
+        # game classes differ in compute threshold: get_compute_threshold(maximum, minimum, start_guess_threshold)
+        book = OpeningBook(depth if depth is not None else OpeningBook.depth)
+
+        for game_class in game_classes:
+            book.questions[game_class.__name__] = dict()
+            db = GameEngine(theme, version)
+            book.__build__(db, game_class, list())
+            db.close()
+
+        return book
+
+    def __build__(self, db: GameEngine, game_class, given_answers: list):
+        threshold = 0.0
+        if given_answers:
+            maximum, minimum = db.entity_min_max_rating()
+            if maximum is None:
+                return
+            threshold = game_class.get_compute_threshold(maximum, minimum, game_class.start_guess_threshold)
+
+        questions = AkinationAlgorithms.best_question(db, threshold)
+        if not questions:
+            return
+
+        question_id = questions[0][0]
+        self.questions[game_class.__name__][OpeningBook.key(given_answers)] = question_id
+
+        if len(given_answers) + 1 >= self.depth:
+            return
+
+        for answer_value in AkinationAlgorithms.given_answer_values:
+            # no entity is used yet, so all of them get the increase same as by both game classes
+            next_db = GameEngine(db.theme, db.version)
+            next_db.load_state(*db.dump_state())
+            next_db.question_set_used(question_id)
+            AkinationAlgorithms.increasemany_rating(next_db, [(question_id, answer_value)])
+            self.__build__(next_db, game_class, given_answers + [(question_id, answer_value)])
+            next_db.close()
+
+
+# Results of turns shared between games: games of a theme version with the same history have the same ratings,
+# so their compute threshold, best entities and best questions are computed once
+class TurnCache():
+    size_limit: int = 10000
+    # games only ask the best question, a few more are kept instead of all questions of theme
+    question_count: int = 4
+    hits: int = 0
+    misses: int = 0
+
+    # least recently used first: OrderedDict[tuple, dict] as entry for game class name, theme, version and history
+    __entries__: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def key(game_class: str, theme: str, version: Version, history: tuple) -> tuple:
+        return game_class, theme, version.to_string(), history
+
+    @staticmethod
+    def get(key: tuple) -> dict:  # None if not cached
+        entry = TurnCache.__entries__.get(key)
+        if entry is None:
+            TurnCache.misses += 1
+            return None
+
+        TurnCache.hits += 1
+        TurnCache.__entries__.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def put(key: tuple, entry: dict):
+        TurnCache.__entries__[key] = entry
+        TurnCache.__entries__.move_to_end(key)
+        while len(TurnCache.__entries__) > TurnCache.size_limit:
+            TurnCache.__entries__.popitem(last=False)
+
+    @staticmethod
+    def invalidate(theme: str):
+        for key in list(TurnCache.__entries__):
+            if key[1] == theme:
+                del TurnCache.__entries__[key]
+
+    @staticmethod
+    def hit_rate() -> float:
+        lookups = TurnCache.hits + TurnCache.misses
+        return TurnCache.hits / lookups if lookups else 0.0
 
 
 class AkinatorState(IntEnum):
@@ -154,34 +521,63 @@ class Akinator():
     start_selective_rating_increase_iteration: int = 7
     start_guess_iteration: int = 5
     guess_limit: int = 7
+    # leader and the next one are enough to decide upon a guess
+    probable_entity_count: int = 2
 
     guess_threshold_entity_multiplier: float = 0.85
     guess_threshold_question_multiplier: float = 1.05
     guess_threshold_minimum: float = 0.5
     leader_difference: float = 0.5
+    start_guess_threshold: float = 0.5
+
+    # games of versions with clustered entities rate only clusters for the first answers, then entities of clusters
+    # rated in the top cluster_survival part of cluster ratings range are rated with all answers and others are no
+    # longer candidates, off as descent lowers win rate and adds time per turn in test games (see test_clusters)
+    cluster_turns: int = 0
+    cluster_survival: float = 0.75
+
+    @staticmethod
+    def get_compute_threshold(maximum: float, minimum: float, guess_threshold: float) -> float:
+        return minimum + (maximum - minimum) / 2 # * guess_threshold
+        #minimum * guess_threshold + maximum * (1 - guess_threshold)
 
     def clear(self):
         self.state = AkinatorState.AskQuestion
         self.iteration = 0
         self.guess_count = 0
-        self.guess_threshold = 0.5
+        self.guess_threshold = Akinator.start_guess_threshold
         self.compute_threshold = 0.0
+        self.history.clear()
+        self.turn = None
         self.user_answers.clear()
         self.probable_entities.clear()
         self.probable_questions.clear()
         self.wrong_entities.clear()
         self.stats_recomputed = False
 
-    def __init__(self, theme: str, version: Version, connection_type: Connection.Type = Connection.Type.game):
-        self.db = Connection(connection_type, theme, version)
+    def __init__(self, theme: str, version: Version, algorithms=None, shards: ShardPool = None):
+        # AkinationAlgorithms or BayesianAlgorithms
+        self.algorithms = algorithms if algorithms is not None else AkinationAlgorithms.of_theme(theme)
+        # game over worker processes of shards (of the same theme version) scored with AkinationAlgorithms
+        if shards is not None and self.algorithms is not AkinationAlgorithms:
+            raise ShardPool.Error(ShardPool.Error.Type.unsharded_algorithms)
+        # pools of smaller theme versions than ShardPool.entity_minimum are not used
+        self.db = ShardedGame(shards) if shards is not None and shards.serves() else GameEngine(theme, version)
+        # opening book and turn cache entries are kept per game class and algorithms
+        self.name = Akinator.__name__ if self.algorithms is AkinationAlgorithms else \
+            f"{Akinator.__name__}.{self.algorithms.__name__}"
+        self.opening_book = OpeningBook.get(theme, version)
         self.update = Update()
+        # game over clusters while answers are applied to clusters only
+        self.cluster_db = GameEngine(theme, version, clusters=True) \
+            if Akinator.cluster_turns and shards is None and self.db.matrix.clusters is not None else None
 
         self.state = AkinatorState.AskQuestion
         self.iteration = 0
         self.guess_count = 0
 
         self.stats_recomputed = False
-        self.guess_threshold = 0.5
+        self.guess_threshold = Akinator.start_guess_threshold
         self.compute_threshold = 0.0
 
         self.probable_entities = list()  # list[tuple[int, float]
@@ -190,27 +586,72 @@ class Akinator():
         self.user_answers = list()  # list[tuple[float, int]]
         self.wrong_entities = list()  # list[int]
 
+        # everything that changed ratings in order: tuple[question id, answer value, is selective] for applied
+        # answers and tuple[entity id] for guessed entities
+        self.history = list()  # list[tuple]
+        self.turn = None  # TurnCache entry of current history
+
         self.clear()
 
     def __del__(self):
-        self.db.close()
+        # games are not started when construction fails
+        if getattr(self, "db", None) is not None:
+            self.db.close()
+        if getattr(self, "cluster_db", None) is not None:
+            self.cluster_db.close()
+
+    def __recompute_cluster_stats(self, last_answer: GivenAnswer):
+        self.algorithms.increase_rating(self.cluster_db, last_answer, -100.0)
+        # answers applied to entities only when game descends into clusters
+        self.history.append((last_answer.question_id, last_answer.answer_value, None))
+        self.turn = None
+
+        maximum, minimum = self.cluster_db.entity_min_max_rating()
+        self.compute_threshold = self.algorithms.compute_threshold(Akinator, maximum, minimum, self.guess_threshold)
+        self.probable_entities = list()
+        self.stats_recomputed = True
+
+    def __descend(self):
+        maximum, minimum = self.cluster_db.entity_min_max_rating()
+        self.db.keep_clusters(self.cluster_db.entities_over(maximum - (maximum - minimum) * Akinator.cluster_survival))
+        self.algorithms.increasemany_rating(self.db, [(answer.question_id, answer.answer_value)
+                                                      for answer in self.user_answers[:-1]])
+        self.cluster_db.close()
+        self.cluster_db = None
 
     def __recompute_stats(self):
         if not self.user_answers:
             self.stats_recomputed = True
             return
 
-        if self.iteration <= Akinator.start_selective_rating_increase_iteration:
-            AkinationAlgorithms.increase_rating(self.db, self.user_answers[-1], -100.0)
+        last_answer = self.user_answers[-1]
+        if self.cluster_db is not None:
+            if len(self.user_answers) <= Akinator.cluster_turns:
+                self.__recompute_cluster_stats(last_answer)
+                return
+            self.__descend()
+
+        selective = self.iteration > Akinator.start_selective_rating_increase_iteration
+        if not selective:
+            self.algorithms.increase_rating(self.db, last_answer, -100.0)
         else:
-            AkinationAlgorithms.increase_rating(self.db, self.user_answers[-1], self.compute_threshold)
+            self.algorithms.increase_rating(self.db, last_answer, self.compute_threshold)
+        self.history.append((last_answer.question_id, last_answer.answer_value, selective))
 
-        maximum, minimum = self.db.entity_min_max_rating()
+        key = TurnCache.key(self.name, self.db.theme, self.db.version, tuple(self.history))
+        self.turn = TurnCache.get(key)
 
-        self.compute_threshold = minimum + (maximum - minimum) / 2 # * self.guess_threshold
-        #minimum * self.guess_threshold + maximum * (1 - self.guess_threshold)
+        if self.turn is None:
+            maximum, minimum = self.db.entity_min_max_rating()
+            compute_threshold = self.algorithms.compute_threshold(Akinator, maximum, minimum, self.guess_threshold)
+            self.turn = {"compute_threshold": compute_threshold, "probable_questions": None,
+                         "probable_entities": self.algorithms.best_character(self.db, compute_threshold,
+                                                                             Akinator.probable_entity_count)}
+            TurnCache.put(key, self.turn)
+
+        self.compute_threshold = self.turn["compute_threshold"]
         print("COMPUTE THRESHOLD: ", self.compute_threshold)
-        self.probable_entities = AkinationAlgorithms.best_character(self.db, self.compute_threshold).fetchall()
+        self.probable_entities = list(self.turn["probable_entities"])
         self.stats_recomputed = True
 
     def choose_chars(self) -> list:  # list[tuple[int, float]]
@@ -224,6 +665,8 @@ class Akinator():
 
         if len(self.probable_entities) == 1:
             return True
+        elif len(self.probable_entities) == 0:
+            return False
 
         leader_rating = self.probable_entities[0][1]
         next_rating = self.probable_entities[1][1]
@@ -231,14 +674,19 @@ class Akinator():
         print(f"LEADER RATINGS: ({leader_rating}, {next_rating})")
         print(f"GUESS THRESHOLD: {self.guess_threshold}")
 
-        return leader_rating - next_rating >= self.guess_threshold * Akinator.leader_difference # * \
+        return self.algorithms.leader_is_good(self.db, leader_rating, next_rating,
+                                              self.guess_threshold * Akinator.leader_difference) # * \
                # self.iteration / Akinator.iteration_limit
 
     def mark_entity(self, id: int):
         self.db.entity_set_used(id)
+        self.history.append((id,))
+        self.turn = None
 
     def mark_question(self, id: int):
         self.db.question_set_used(id)
+        if self.cluster_db is not None:
+            self.cluster_db.question_set_used(id)
 
     def guess(self) -> tuple:  # tuple[id, name]
         id = self.probable_entities[0][0]
@@ -249,14 +697,15 @@ class Akinator():
         return id, name
 
     def last_guess(self) -> tuple:  # tuple[list[tuple[id, name]], int]
-        ids = [entity[0] for entity in self.probable_entities]
-        names = [self.db.entity_get_name(id) for id in ids]
+        count = Akinator.guess_limit - self.guess_count
+        ids = [entity[0] for entity in self.algorithms.best_character(self.db, self.compute_threshold, count)]
+        names = self.db.entity_get_names(ids)
 
         #for id in ids:
         #    self.mark_entity(id)
         #    self.guess_count += 1
 
-        return list(zip(ids, names)), Akinator.guess_limit - self.guess_count
+        return list(zip(ids, names)), count
 
     def ask_question(self) -> tuple:  # tuple[id, text]
         id = self.probable_questions[0][0]
@@ -270,7 +719,23 @@ class Akinator():
 
         self.guess_threshold *= Akinator.guess_threshold_question_multiplier
 
-        self.probable_questions = AkinationAlgorithms.best_question(self.db, self.compute_threshold).fetchall()
+        question_id = None
+        # opening book is built without clusters: questions splitting clusters come first
+        if not self.guess_count and self.cluster_db is None:
+            question_id = self.opening_book.question(self.name, [(answer.question_id, answer.answer_value)
+                                                                 for answer in self.user_answers])
+        if self.cluster_db is not None:
+            # questions splitting clusters
+            self.probable_questions = self.algorithms.best_question(self.cluster_db, self.compute_threshold)
+        elif question_id is not None:
+            self.probable_questions = [(question_id,)]
+        elif self.turn is not None:
+            if self.turn["probable_questions"] is None:
+                self.turn["probable_questions"] = \
+                    self.algorithms.best_question(self.db, self.compute_threshold)[:TurnCache.question_count]
+            self.probable_questions = list(self.turn["probable_questions"])
+        else:
+            self.probable_questions = self.algorithms.best_question(self.db, self.compute_threshold)
 
         return self.probable_questions
 
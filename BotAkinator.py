@@ -1,7 +1,77 @@
-from Akinator import GivenAnswer, AkinatorState, AkinationAlgorithms
+from Akinator import GivenAnswer, AkinatorState, AkinationAlgorithms, OpeningBook, TurnCache
 from bot_db import BotDB
 from VersionClass import Version
-from ConnectionClass import Connection
+from EngineClass import GameEngine
+from collections import OrderedDict
+from time import monotonic
+
+
+# Game engines of chats kept alive between their turns: a chat found here continues its game in memory instead of
+# loading the saved game state from BotDB, which remains the state of chats evicted or not played yet
+class BotSessions():
+    size_limit: int = 256
+    # sessions unused for longer are evicted even below size_limit
+    idle_seconds: float = 900.0
+    hits: int = 0
+    misses: int = 0
+
+    # least recently used first: OrderedDict[int, tuple[GameEngine, int, int, float]] as engine of chat with
+    # answer and wrong guess counts of its saved game state and time of the last use
+    __sessions__: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def take(chat_id: int, theme: str, version: Version, answer_count: int, guess_count: int) -> GameEngine:
+        # None unless engine of chat has the saved game state, session leaves the pool while its turn is played
+        BotSessions.__evict_idle__()
+        session = BotSessions.__sessions__.pop(chat_id, None)
+        if session is None:
+            BotSessions.misses += 1
+            return None
+
+        game_db, session_answer_count, session_guess_count, _ = session
+        if game_db.theme != theme or game_db.version.to_string() != version.to_string() or \
+                (session_answer_count, session_guess_count) != (answer_count, guess_count):
+            game_db.close()
+            BotSessions.misses += 1
+            return None
+
+        BotSessions.hits += 1
+        return game_db
+
+    @staticmethod
+    def put(chat_id: int, game_db: GameEngine, answer_count: int, guess_count: int):
+        BotSessions.discard(chat_id)
+        BotSessions.__sessions__[chat_id] = (game_db, answer_count, guess_count, monotonic())
+        while len(BotSessions.__sessions__) > BotSessions.size_limit:
+            BotSessions.__sessions__.popitem(last=False)[1][0].close()
+        BotSessions.__evict_idle__()
+
+    @staticmethod
+    def discard(chat_id: int):
+        session = BotSessions.__sessions__.pop(chat_id, None)
+        if session is not None:
+            session[0].close()
+
+    @staticmethod
+    def invalidate(theme: str):
+        for chat_id, session in list(BotSessions.__sessions__.items()):
+            if session[0].theme == theme:
+                BotSessions.discard(chat_id)
+
+    @staticmethod
+    def __evict_idle__():
+        expired = monotonic() - BotSessions.idle_seconds
+        while BotSessions.__sessions__ and next(iter(BotSessions.__sessions__.values()))[3] < expired:
+            BotSessions.__sessions__.popitem(last=False)[1][0].close()
+
+    @staticmethod
+    def session_count() -> int:
+        return len(BotSessions.__sessions__)
+
+    @staticmethod
+    def hit_rate() -> float:
+        lookups = BotSessions.hits + BotSessions.misses
+        return BotSessions.hits / lookups if lookups else 0.0
 
 
 class BotAkinator():
@@ -9,40 +79,68 @@ class BotAkinator():
     start_selective_rating_increase_iteration: int = 7
     start_guess_iteration: int = 5
     guess_limit: int = 7
+    # leader and the next one are enough to decide upon a guess
+    probable_entity_count: int = 2
 
     guess_threshold_entity_multiplier: float = 0.85
     guess_threshold_question_multiplier: float = 1.05
     guess_threshold_minimum: float = 0.5
     leader_difference: float = 0.5
+    start_guess_threshold: float = 0.5
 
-    def __init__(self, theme: str, version: Version, chat_id: int,
-                 connection_type: Connection.Type = Connection.Type.game):
-        self.game_db = Connection(connection_type, theme, version)
+    @staticmethod
+    def get_compute_threshold(maximum: float, minimum: float, guess_threshold: float) -> float:
+        # same as (max-min)/2+[max-guess_threshold-(max-min)/2]/2
+        return 0.5 * (1.5 * maximum - 0.5 * minimum - guess_threshold)
+        #return minimum + (maximum - minimum) / 2 # * guess_threshold
+        #minimum * guess_threshold + maximum * abs(1 - guess_threshold)
+
+    def __init__(self, theme: str, version: Version, chat_id: int):
+        self.game_db = None
         bot_db = BotDB()
 
+        # AkinationAlgorithms or BayesianAlgorithms
+        self.algorithms = AkinationAlgorithms.of_theme(theme)
+        # opening book and turn cache entries are kept per game class and algorithms
+        self.name = BotAkinator.__name__ if self.algorithms is AkinationAlgorithms else \
+            f"{BotAkinator.__name__}.{self.algorithms.__name__}"
+
         self.chat_id = chat_id
         iteration, state = bot_db.get_iteration_and_state(chat_id)
 
         self.iteration = iteration or 0
         self.state = AkinatorState(state) or AkinatorState.AskQuestion
 
+        # whole history of the game: list[tuple[int, float]] and list[tuple[int]]
+        self.given_answers = bot_db.get_given_answers_since(chat_id, 0, ["question_id", "answer_value"])
+        self.wrong_guesses = bot_db.get_wrong_guesses_since(chat_id, 0, ["entity_id"])
 
-        # list[tuple[int, float]]
-        self.user_answers = bot_db.get_given_answers(chat_id, ["question_id", "answer_value"]) or list()
-        self.wrong_entities = bot_db.get_wrong_guesses(chat_id, ["entity_id"]) or list()  # list[tuple[int]]
+        # answers and wrong guesses already applied to the saved game state are not applied again
+        self.answer_count, self.guess_count = self.__load_state(theme, version, bot_db)
+        # changes of this turn are saved to undo it when its answer or guess is taken back
+        self.loaded_counts = self.answer_count, self.guess_count
+        self.game_db.start_delta()
+
+        # list[tuple[int, float]] of answers not yet applied to ratings
+        self.user_answers = self.given_answers[self.answer_count:]
+        # list[tuple[int]]
+        self.wrong_entities = self.wrong_guesses[self.guess_count:]
 
-        bot_db.close()
         if self.user_answers:
-            self.game_db.__updatemany__("questions", "id", ["used"],
-                                        [(1, id) for id, answer_value in self.user_answers])
-        self.guess_count = 0
+            self.game_db.questions_set_used([id for id, answer_value in self.user_answers])
+            self.answer_count += len(self.user_answers)
         if self.wrong_entities:
-            self.game_db.__updatemany__("entities", "id", ["rating", "used"],
-                                        [(-10000.0, 1, id[0]) for id in self.wrong_entities])
-            self.guess_count = len(self.wrong_entities)
+            self.game_db.entities_set_wrong([id[0] for id in self.wrong_entities])
+            self.guess_count += len(self.wrong_entities)
+
+        self.opening_book = OpeningBook.get(theme, version)
+        # ratings do not depend on order of wrong guesses
+        self.turn_key = TurnCache.key(self.name, theme, version,
+                                      (tuple(self.given_answers), tuple(sorted(self.wrong_guesses))))
+        self.turn = None  # TurnCache entry of current history
 
         self.stats_recomputed = False
-        self.guess_threshold = 0.5
+        self.guess_threshold = BotAkinator.start_guess_threshold
         self.compute_threshold = 0.0
 
         self.probable_entities = list()  # list[tuple[int, float]
@@ -50,24 +148,88 @@ class BotAkinator():
 
         self.next_state()
 
+        self.__save_state(bot_db)
+        bot_db.close()
+
     def __del__(self):
-        self.game_db.close()
+        if self.game_db is not None:
+            self.game_db.close()
+
+    def release(self):
+        # engine of a game still going on is kept for the next turn of chat
+        if self.game_db is None:
+            return
+        if self.state in (AkinatorState.Victory, AkinatorState.GiveUp):
+            self.game_db.close()
+        else:
+            BotSessions.put(self.chat_id, self.game_db, *self.saved_counts)
+        self.game_db = None
+
+    def __load_state(self, theme: str, version: Version, bot_db: BotDB) -> tuple:
+        # tuple[int, int] as applied answer and wrong guess counts
+        saved = bot_db.get_game_state_counts(self.chat_id)
+        if saved is not None and (saved[0] != theme or saved[1] != version.to_string()):
+            bot_db.remove_game_state(self.chat_id)
+            saved = None
+
+        if saved is None:
+            BotSessions.discard(self.chat_id)
+            self.game_db = GameEngine(theme, version)
+            return 0, 0
+
+        answer_count, guess_count = saved[2:]
+        # ratings blob is only read when engine of chat is not alive
+        self.game_db = BotSessions.take(self.chat_id, theme, version, answer_count, guess_count)
+        if self.game_db is None:
+            self.game_db = GameEngine(theme, version)
+            self.game_db.load_state(*bot_db.get_game_state(self.chat_id)[4:])
+
+        # answers or guesses taken back are undone turn by turn
+        while answer_count > len(self.given_answers) or guess_count > len(self.wrong_guesses):
+            delta = bot_db.get_last_game_delta(self.chat_id)
+            if delta is None:
+                # changes are not known: the game is replayed from the start
+                bot_db.remove_game_state(self.chat_id)
+                self.game_db.close()
+                self.game_db = GameEngine(theme, version)
+                return 0, 0
+
+            answer_count, guess_count = delta[:2]
+            self.game_db.undo_delta(*delta[2:])
+            bot_db.remove_last_game_delta(self.chat_id)
+
+        return answer_count, guess_count
+
+    def __save_state(self, bot_db: BotDB):
+        delta = self.game_db.take_delta()
+        if (self.answer_count, self.guess_count) != self.loaded_counts:
+            bot_db.add_game_delta(self.chat_id, *self.loaded_counts, *delta)
+        # counts of the saved game state, a guess made later in the turn is not applied to it
+        self.saved_counts = self.answer_count, self.guess_count
+        bot_db.save_game_state(self.chat_id, self.game_db.theme, self.game_db.version.to_string(),
+                               self.answer_count, self.guess_count, *self.game_db.dump_state())
 
     def __recompute_stats(self):
-        if not self.user_answers:
+        if not self.answer_count:
             self.stats_recomputed = True
             return
 
-        AkinationAlgorithms.increasemany_rating(self.game_db, self.user_answers)
+        # only the answers given since the last turn
+        self.algorithms.increasemany_rating(self.game_db, self.user_answers)
+        self.user_answers = list()
 
-        maximum, minimum = self.game_db.entity_min_max_rating()
+        self.turn = TurnCache.get(self.turn_key)
 
-        # same as (max-min)/2+[max-guess_threshold-(max-min)/2]/2
-        self.compute_threshold = 0.5 * (1.5 * maximum - 0.5 * minimum - self.guess_threshold)
+        if self.turn is None:
+            maximum, minimum = self.game_db.entity_min_max_rating()
+            compute_threshold = self.algorithms.compute_threshold(BotAkinator, maximum, minimum, self.guess_threshold)
+            self.turn = {"compute_threshold": compute_threshold, "probable_questions": None,
+                         "probable_entities": self.algorithms.best_character(self.game_db, compute_threshold,
+                                                                             BotAkinator.probable_entity_count)}
+            TurnCache.put(self.turn_key, self.turn)
 
-        #self.compute_threshold = minimum + (maximum - minimum) / 2 # * self.guess_threshold
-        #minimum * self.guess_threshold + maximum * abs(1 - self.guess_threshold)
-        self.probable_entities = AkinationAlgorithms.best_character(self.game_db, self.compute_threshold).fetchall()
+        self.compute_threshold = self.turn["compute_threshold"]
+        self.probable_entities = list(self.turn["probable_entities"])
         self.stats_recomputed = True
 
     def choose_chars(self) -> list:  # list[tuple[int, float]]
@@ -87,7 +249,8 @@ class BotAkinator():
         leader_rating = self.probable_entities[0][1]
         next_rating = self.probable_entities[1][1]
 
-        return leader_rating - next_rating >= self.compute_threshold * BotAkinator.leader_difference
+        return self.algorithms.leader_is_good(self.game_db, leader_rating, next_rating,
+                                              self.compute_threshold * BotAkinator.leader_difference)
         #return leader_rating - next_rating >= self.guess_threshold * BotAkinator.leader_difference # * \
                # self.iteration / BotAkinator.iteration_limit
 
@@ -99,8 +262,7 @@ class BotAkinator():
         return id, name
 
     def last_guess(self) -> tuple:  # tuple[list[tuple[id, name]], int]
-        id = self.game_db.execute(f"SELECT id FROM entities_{self.game_db.id} "
-                                  f"WHERE used==0 ORDER BY rating DESC").fetchone()[0]
+        id = self.game_db.entity_ratings(count=1)[0][0]
         name = self.game_db.entity_get_name(id)
         return id, name
 
@@ -114,7 +276,20 @@ class BotAkinator():
             self.__recompute_stats()
 
         self.guess_threshold *= BotAkinator.guess_threshold_question_multiplier ** self.iteration
-        self.probable_questions = AkinationAlgorithms.best_question(self.game_db, self.compute_threshold).fetchall()
+
+        question_id = None
+        if not self.guess_count:
+            question_id = self.opening_book.question(self.name, self.given_answers)
+
+        if question_id is not None:
+            self.probable_questions = [(question_id,)]
+        elif self.turn is not None:
+            if self.turn["probable_questions"] is None:
+                self.turn["probable_questions"] = \
+                    self.algorithms.best_question(self.game_db, self.compute_threshold)[:TurnCache.question_count]
+            self.probable_questions = list(self.turn["probable_questions"])
+        else:
+            self.probable_questions = self.algorithms.best_question(self.game_db, self.compute_threshold)
 
         return self.probable_questions
 
@@ -68,6 +68,9 @@ class Connection(sqlConnection):
         if self.connection_type is self.Type.server or self.connection_type is self.Type.client:
             if self.connection_type is self.Type.server:
                 self.__create_table__(Layouts.Table.entities_server.value)
+                self.__create_table__(Layouts.Table.question_stats.value)
+                self.__create_table__(Layouts.Table.question_partners.value)
+                self.__create_table__(Layouts.Table.entity_clusters.value)
             else:
                 self.__create_table__(Layouts.Table.entities_client.value)
 
@@ -370,6 +373,27 @@ class Connection(sqlConnection):
         self.stats.data["answers_count"] += len(values)
         self.stats.write_data()
 
+    def replace_question_stats(self, values: list):  # list[tuple[int, int, int, int, float]]
+        self.begin_transaction()
+        # tables of older versions have balance and coverage columns
+        self.execute("DROP TABLE IF EXISTS question_stats")
+        self.__create_table__(Layouts.Table.question_stats.value)
+        self.executemany("INSERT INTO question_stats(question_id, yes_count, no_count, answer_count, entropy) "
+                         "VALUES(?, ?, ?, ?, ?)", values)
+        self.commit()
+
+    def replace_question_partners(self, values: list):  # list[tuple[int, int, float]]
+        self.begin_transaction()
+        self.execute("DELETE FROM question_partners")
+        self.executemany("INSERT INTO question_partners(question_id, partner_id, correlation) VALUES(?, ?, ?)", values)
+        self.commit()
+
+    def replace_entity_clusters(self, values: list):  # list[tuple[int, int]]
+        self.begin_transaction()
+        self.execute("DELETE FROM entity_clusters")
+        self.executemany("INSERT INTO entity_clusters(entity_id, cluster) VALUES(?, ?)", values)
+        self.commit()
+
     def entities_answering_question(self, question_id: int) -> Cursor:
         if self.connection_type == self.Type.game:
             return self.execute("SELECT tmp.entity_id, tmp.answer_value, e.rating "
@@ -416,6 +440,8 @@ class Connection(sqlConnection):
             answer_item = (row["question_id"], row["answer_value"])
             result_item[2].append(answer_item)
 
+        if current_entity_id != -1:
+            result.append(result_item)
         return result
 
     def question_ratings(self, threshold: float) -> Cursor:
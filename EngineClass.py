@@ -0,0 +1,1099 @@
+import numpy as np
+from json import dumps, loads
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from sqlite3 import connect as sql_connect, OperationalError
+from os import replace, stat, name as os_name
+from os.path import isfile
+from sys import getrefcount
+from VersionClass import Version
+from MyError import MyError, MyErrorType
+from file_management import PathCreator
+
+
+# Answers of one theme version as a compact entity x question matrix
+# Rows and columns are positions in sorted id arrays, answers are kept per question (column-wise)
+class ThemeMatrix():
+    class Error(MyError):
+        class Type(MyErrorType):
+            db_not_found = "Theme version data base file does not exist"
+
+        def __init__(self, error_type: Type, theme: str = None, version: Version = None):
+            info = dict()
+            if theme is not None:
+                info["theme"] = theme
+            if version is not None:
+                info["version"] = version.to_string()
+
+            MyError.__init__(self, error_type, info=info)
+
+        def __str__(self) -> str:
+            return MyError.__str__(self)
+
+    # question partners kept by question_partners: correlated questions with enough answers
+    partner_count: int = 5
+    partner_correlation: float = 0.6
+    partner_answer_minimum: int = 5
+
+    # entities of large themes are clustered when version is published, see clustering
+    cluster_entity_minimum: int = 50000
+    clustering_iterations: int = 10
+    # clusters answer a question when mean answer of their members is at least cluster_answer_minimum in magnitude
+    cluster_answer_minimum: float = 0.25
+
+    # process-wide registry of read-only snapshots: dict[tuple[str, str], ThemeMatrix]
+    # a snapshot stays here while it is the latest one of its theme or while some game still uses it
+    __registry__: dict = dict()
+
+    # arrays of a snapshot published to shared memory, see publish and attach
+    __shared_arrays__: tuple = ("entity_ids", "entity_positions", "base_ratings", "question_ids", "question_positions",
+                                "answer_entities", "answer_levels", "answer_codes",
+                                "question_answer_counts", "question_offsets", "question_split_counts",
+                                "question_entropies",
+                                "entity_answer_splits", "entity_offsets",
+                                "partner_questions", "partner_correlations", "partner_offsets",
+                                "no_entities", "no_questions", "all_entities", "all_entity_bits",
+                                "entity_clusters", "cluster_entities", "cluster_offsets",
+                                "entity_name_bytes", "entity_name_offsets", "question_text_bytes",
+                                "question_text_offsets")
+    # shared memory segments published by this process: dict[tuple[str, str], list[SharedMemory]]
+    __published__: dict = dict()
+    # unpublished segments arrays of running games may still use: list[SharedMemory]
+    __retired__: list = list()
+    # references to the mapping of each published segment while no array uses it: dict[str, int] by segment name
+    # arrays keep the mapping as their base but not as an exported buffer, closing it under them is not an error
+    __references__: dict = dict()
+    # shared memory segments attached by this process: dict[str, SharedMemory] by segment name
+    # they stay mapped until the process exits, arrays of snapshots may still use them
+    __attached__: dict = dict()
+    # resource tracker registers segments opened on POSIX systems only
+    __tracked__: bool = os_name == "posix"
+
+    @staticmethod
+    def acquire(theme: str, version: Version, shard: tuple = None):  # shard is tuple[index, count] or None
+        key = (theme, version.to_string()) + (shard or ())
+        matrix = ThemeMatrix.__registry__.get(key)
+        if matrix is None:
+            # a snapshot published by a loader process is attached, a compiled one is mapped, others are built
+            if shard is None:
+                matrix = ThemeMatrix.attach(theme, version) or ThemeMatrix.open_compiled(theme, version)
+            if matrix is None:
+                matrix = ThemeMatrix(theme, version, shard)
+            if shard is None:
+                ThemeMatrix.replace(theme, version)
+                # an older version acquired after a newer one is released after its last game too
+                matrix.replaced = any(ThemeMatrix.__older__(version, other.version)
+                                      for other in ThemeMatrix.__registry__.values() if other.theme == theme)
+            ThemeMatrix.__registry__[key] = matrix
+        matrix.game_count += 1
+        return matrix
+
+    @staticmethod
+    def replace(theme: str, version: Version = None):
+        # called when a newer version of theme appears: snapshots older than version, all of theme without it,
+        # are released after their last game
+        for key, matrix in list(ThemeMatrix.__registry__.items()):
+            if key[0] == theme and (version is None or ThemeMatrix.__older__(matrix.version, version)):
+                ThemeMatrix.__retire__(key)
+
+    @staticmethod
+    def __retire__(key: tuple):
+        # snapshot of key is released after its last game, later games acquire a new one
+        matrix = ThemeMatrix.__registry__.get(key)
+        if matrix is not None:
+            matrix.replaced = True
+            if matrix.game_count == 0:
+                del ThemeMatrix.__registry__[key]
+
+    @staticmethod
+    def __older__(version: Version, other: Version) -> bool:
+        # versions without micro go before their micro versions
+        micro, other_micro = getattr(version, "micro", None), getattr(other, "micro", None)
+        return (version.major, version.minor, -1 if micro is None else micro) < \
+            (other.major, other.minor, -1 if other_micro is None else other_micro)
+
+    def release(self):
+        self.game_count -= 1
+        if self.game_count <= 0 and self.replaced:
+            ThemeMatrix.__registry__.pop((self.theme, self.version.to_string()) + (self.shard or ()), None)
+
+    def __init__(self, theme: str, version: Version, shard: tuple = None):
+        self.theme = theme
+        self.version = version
+        self.path = PathCreator.db(theme, version)
+        # shard (index, count) holds only the index-th of count equal parts of entities in order of ids
+        self.shard = shard
+
+        if not isfile(self.path):
+            raise self.Error(self.Error.Type.db_not_found, theme, version)
+
+        db = sql_connect(self.path)
+        entities = db.execute("SELECT id, base_rating FROM entities ORDER BY id").fetchall()
+        questions = db.execute("SELECT id FROM questions ORDER BY id").fetchall()
+        if shard is not None:
+            index, count = shard
+            entities = entities[len(entities) * index // count:len(entities) * (index + 1) // count]
+            answers = db.execute("SELECT entity_id, question_id, answer_value FROM answers "
+                                 "WHERE entity_id BETWEEN ? AND ? ORDER BY rowid",
+                                 (entities[0][0], entities[-1][0]) if entities else (0, -1)).fetchall()
+        else:
+            answers = db.execute("SELECT entity_id, question_id, answer_value FROM answers ORDER BY rowid").fetchall()
+        try:
+            stats = db.execute("SELECT question_id, yes_count, no_count, answer_count, entropy "
+                               "FROM question_stats").fetchall()
+            partners = db.execute("SELECT question_id, partner_id, correlation FROM question_partners").fetchall()
+            clusters = db.execute("SELECT entity_id, cluster FROM entity_clusters").fetchall()
+        except OperationalError:
+            # versions published before question stats, partners and clusters
+            stats, partners, clusters = list(), list(), list()
+        db.close()
+        if shard is not None:
+            # stats are counted over all entities, shards are not clustered
+            stats, clusters = list(), list()
+
+        self.__build__(entities, questions, answers, stats, partners)
+        # clusters of entities played as entities of a smaller matrix, None if entities are not clustered
+        self.clusters = self.__cluster_matrix__(clusters, questions, partners)
+
+        self.game_count = 0
+        self.replaced = False
+
+    def __build__(self, entities: list, questions: list, answers: list, stats: list, partners: list):
+        # rows of entities, questions, answers, question_stats and question_partners tables
+        self.entity_ids = np.array([e[0] for e in entities], dtype=np.int64)
+        self.base_ratings = np.array([e[1] for e in entities], dtype=np.float64)
+        self.question_ids = np.array([q[0] for q in questions], dtype=np.int64)
+        # ids of entities and questions are mapped to dense positions 0..N-1 in order of ids and back:
+        # position of entity with id i is entity_positions[i], -1 for ids without entity
+        self.entity_positions = self.__inverse__(self.entity_ids)
+        self.question_positions = self.__inverse__(self.question_ids)
+
+        answers = np.array(answers, dtype=np.float64).reshape(-1, 3)
+        entity_ids, question_ids, values = answers[:, 0].astype(np.int64), answers[:, 1].astype(np.int64), answers[:, 2]
+
+        # answers may reference deleted entities or questions: those are dropped same as by the SQL joins
+        entities_ = self.__positions__(self.entity_ids, entity_ids)
+        questions_ = self.__positions__(self.question_ids, question_ids)
+        known = (entities_ >= 0) & (questions_ >= 0)
+        entities_, questions_, values = entities_[known], questions_[known], values[known]
+
+        # stable sort keeps insertion order of repeated (entity, question) pairs: only the first one is used,
+        # same as the primary key of answers table and get_rating_increasemany
+        order = np.lexsort((entities_, questions_))
+        entities_, questions_, values = entities_[order], questions_[order], values[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (entities_[1:] != entities_[:-1]) | (questions_[1:] != questions_[:-1])
+
+        # answers are kept once per question (column-wise) as entity position and value code and once per entity
+        # (row-wise) as split key holding question and sign of value: 9 bytes per answer
+        self.answer_entities = entities_[first].astype(np.int32)
+        answer_questions = questions_[first].astype(np.int32)
+
+        # answer values are a small discrete set kept as one byte codes: value of answer i is
+        # answer_levels[answer_codes[i]], scores are looked up by code in tables of the levels
+        self.answer_levels, answer_codes = np.unique(values[first], return_inverse=True)
+        self.answer_codes = answer_codes.reshape(-1).astype(np.uint8)
+
+        # question position * 3 + 0, 1 or 2 for no, unknown and yes answers: one bincount splits all questions
+        answer_splits = answer_questions * 3 + (np.sign(self.answer_levels).astype(np.int32) + 1)[self.answer_codes]
+
+        # answers to question at position i are answer_*[question_offsets[i]:question_offsets[i + 1]]
+        self.question_answer_counts = np.bincount(answer_questions, minlength=len(self.question_ids))
+        self.question_offsets = np.zeros(len(self.question_ids) + 1, dtype=np.int64)
+        np.cumsum(self.question_answer_counts, out=self.question_offsets[1:])
+
+        # answers of entity at position i are entity_answer_splits[entity_offsets[i]:entity_offsets[i + 1]],
+        # question position of split key k is k // 3
+        rows = np.argsort(self.answer_entities, kind="stable")
+        self.entity_answer_splits = answer_splits[rows]
+        self.entity_offsets = np.zeros(len(self.entity_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.answer_entities, minlength=len(self.entity_ids)), out=self.entity_offsets[1:])
+
+        # no, unknown and yes answers per question over all entities as question position * 3 + 0, 1 or 2
+        # and entropies of those splits: splits of a game start from them and questions are ranked by the entropies
+        # while all entities are candidates, they are computed when version is published
+        self.question_split_counts, self.question_entropies = self.__split_counts__(stats)
+
+        # questions answered alike by entities, computed when version is published:
+        # partners of question at position i are partner_*[partner_offsets[i]:partner_offsets[i + 1]]
+        partners = np.array(partners, dtype=np.float64).reshape(-1, 3)
+        questions_ = self.__positions__(self.question_ids, partners[:, 0].astype(np.int64))
+        partners_ = self.__positions__(self.question_ids, partners[:, 1].astype(np.int64))
+        known = (questions_ >= 0) & (partners_ >= 0)
+        order = np.argsort(questions_[known], kind="stable")
+        self.partner_questions = partners_[known][order].astype(np.int32)
+        self.partner_correlations = partners[known, 2][order]
+        self.partner_offsets = np.zeros(len(self.question_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(questions_[known], minlength=len(self.question_ids)), out=self.partner_offsets[1:])
+
+        # initial per-game state, games copy it on first write
+        self.no_entities = np.zeros(len(self.entity_ids), dtype=bool)
+        self.no_questions = np.zeros(len(self.question_ids), dtype=bool)
+        self.all_entities = np.ones(len(self.entity_ids), dtype=bool)
+        self.all_entity_bits = np.packbits(self.all_entities)
+        # names and texts packed into arrays, see __pack_strings__
+        self.entity_name_bytes, self.entity_name_offsets = None, None
+        self.question_text_bytes, self.question_text_offsets = None, None
+        self.__lookups__()
+
+        for array in (self.entity_ids, self.base_ratings, self.question_ids, self.answer_entities,
+                      self.answer_levels, self.answer_codes, self.question_answer_counts, self.question_offsets,
+                      self.question_split_counts, self.question_entropies, self.entity_answer_splits, self.entity_offsets,
+                      self.partner_questions, self.partner_correlations, self.partner_offsets,
+                      self.no_entities, self.no_questions, self.all_entities, self.all_entity_bits,
+                      self.entity_positions, self.question_positions):
+            array.flags.writeable = False
+
+    def __lookups__(self):
+        # per process state of a snapshot besides its arrays
+        if self.entity_positions is None:
+            # compiled before positions were kept with arrays
+            self.entity_positions = self.__inverse__(self.entity_ids)
+            self.question_positions = self.__inverse__(self.question_ids)
+        if self.question_entropies is None:
+            # compiled before entropies were kept with arrays
+            splits = self.question_split_counts.reshape(-1, 3)
+            self.question_entropies = self.__entropies__(splits[:, 2], splits[:, 0], len(self.entity_ids))
+
+        # packed bitsets of entities answering a question with a definite value: dict[tuple[int, float], np.ndarray]
+        # built on first use
+        self.definite_bits = dict()
+
+        # names of entities and texts of questions by position, loaded with one query on first use:
+        # list[str] | None
+        self.entity_names = None
+        self.question_texts = None
+
+    @staticmethod
+    def segment_name(theme: str, version: Version) -> str:
+        return f"akinator-{theme}-{version.to_string()}"
+
+    def __arrays__(self) -> list:  # list[tuple[str, np.ndarray]] of arrays kept outside of the process
+        return [(name, getattr(self, name)) for name in ThemeMatrix.__shared_arrays__
+                if getattr(self, name, None) is not None]
+
+    def __pack_strings__(self):
+        # names of entities and texts of questions as utf-8 bytes of all of them and offsets of each one
+        for table, column, prefix in (("entities", "name", "entity_name"), ("questions", "text", "question_text")):
+            if getattr(self, prefix + "_offsets") is None:
+                strings = [string.encode() for string in self.__strings__(table, column)]
+                offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+                np.cumsum([len(string) for string in strings], out=offsets[1:])
+                setattr(self, prefix + "_bytes", np.frombuffer(b"".join(strings), dtype=np.uint8))
+                setattr(self, prefix + "_offsets", offsets)
+
+    @staticmethod
+    def __pack__(arrays: list, info: dict) -> tuple:  # tuple[int, list[tuple[int, memoryview]]]
+        # size and pieces at their offsets: arrays are laid out after a header of their names, types, shapes and
+        # offsets and any other info
+        layout, offset = list(), 0
+        for name, array in arrays:
+            layout.append((name, array.dtype.str, array.shape, offset))
+            offset += (array.nbytes + 63) // 64 * 64
+        header = dumps(dict(info, arrays=layout)).encode()
+        start = (8 + len(header) + 63) // 64 * 64
+
+        pieces = [(0, memoryview(len(header).to_bytes(8, "little") + header))]
+        for (name, array), (_, dtype, shape, array_offset) in zip(arrays, layout):
+            pieces.append((start + array_offset, memoryview(np.ascontiguousarray(array)).cast("B")))
+        return max(start + offset, 1), pieces
+
+    @staticmethod
+    def __unpack__(buffer) -> tuple:  # tuple[dict[str, np.ndarray], dict] as read-only arrays and info
+        header_length = int.from_bytes(bytes(buffer[:8]), "little")
+        info = loads(bytes(buffer[8:8 + header_length]).decode())
+        start = (8 + header_length + 63) // 64 * 64
+
+        arrays = dict()
+        for name, dtype, shape, offset in info.pop("arrays"):
+            array = np.ndarray(tuple(shape), dtype, buffer=buffer, offset=start + offset)
+            array.flags.writeable = False
+            arrays[name] = array
+        return arrays, info
+
+    @staticmethod
+    def __from_arrays__(theme: str, version: Version, arrays: dict):  # ThemeMatrix without clusters
+        matrix = ThemeMatrix.__new__(ThemeMatrix)
+        matrix.theme, matrix.version, matrix.shard = theme, version, None
+        matrix.path = PathCreator.db(theme, version)
+        for name in ThemeMatrix.__shared_arrays__:
+            setattr(matrix, name, arrays.get(name))
+        matrix.__lookups__()
+        matrix.clusters = None
+        matrix.game_count = 0
+        matrix.replaced = False
+        return matrix
+
+    def __publish__(self, name: str) -> SharedMemory:
+        size, pieces = ThemeMatrix.__pack__(self.__arrays__(), dict())
+        segment = SharedMemory(name, create=True, size=size)
+        for offset, piece in pieces:
+            segment.buf[offset:offset + len(piece)] = piece
+        ThemeMatrix.__references__[segment.name] = getrefcount(segment._mmap)
+        return segment
+
+    @staticmethod
+    def publish(theme: str, version: Version):
+        # loader process: arrays of theme version are put to shared memory for other processes to attach,
+        # they stay there until unpublish is called, games of the loader use them too
+        key = theme, version.to_string()
+        if key in ThemeMatrix.__published__:
+            return
+
+        name = ThemeMatrix.segment_name(theme, version)
+        matrix = ThemeMatrix.open_compiled(theme, version) or ThemeMatrix(theme, version)
+        matrix.__pack_strings__()
+        segments = [matrix.__publish__(name)]
+        if matrix.clusters is not None:
+            segments.append(matrix.clusters.__publish__(name + "-clusters"))
+        ThemeMatrix.__published__[key] = segments
+
+        # a private snapshot loaded before is dropped, later games attach published arrays
+        ThemeMatrix.__retire__(key)
+
+    @staticmethod
+    def published(theme: str) -> list:  # list[str] of versions of theme published by this process
+        return [version for published_theme, version in ThemeMatrix.__published__ if published_theme == theme]
+
+    @staticmethod
+    def unpublish(theme: str):
+        # processes attached to segments keep them until they exit, new ones build or attach a newer version
+        for version in ThemeMatrix.published(theme):
+            for segment in ThemeMatrix.__published__.pop((theme, version)):
+                if ThemeMatrix.__tracked__:
+                    # child processes share resource tracker of loader, attaching unregistered the segment there
+                    resource_tracker.register(segment._name, "shared_memory")
+                segment.unlink()
+                ThemeMatrix.__retired__.append(segment)
+            ThemeMatrix.__retire__((theme, version))
+
+        # segments are unmapped once no array of a game of the loader uses them
+        for segment in list(ThemeMatrix.__retired__):
+            if getrefcount(segment._mmap) <= ThemeMatrix.__references__[segment.name]:
+                segment.close()
+                ThemeMatrix.__retired__.remove(segment)
+                del ThemeMatrix.__references__[segment.name]
+
+    @staticmethod
+    def __open_segment__(name: str) -> SharedMemory:
+        # segment belongs to the loader: it must not be unlinked when this process exits
+        try:
+            return SharedMemory(name, track=False)
+        except TypeError:
+            # before Python 3.13 opening a segment registers it to be unlinked at exit, only it is unregistered
+            segment = SharedMemory(name)
+            if ThemeMatrix.__tracked__:
+                resource_tracker.unregister(segment._name, "shared_memory")
+            return segment
+
+    @staticmethod
+    def __attach__(name: str) -> dict:  # dict[str, np.ndarray] as read-only arrays, None if not published
+        segment = ThemeMatrix.__attached__.get(name)
+        if segment is None:
+            try:
+                segment = ThemeMatrix.__open_segment__(name)
+            except FileNotFoundError:
+                return None
+            ThemeMatrix.__attached__[name] = segment
+        return ThemeMatrix.__unpack__(segment.buf)[0]
+
+    @staticmethod
+    def attach(theme: str, version: Version):  # ThemeMatrix or None if theme version is not published
+        segments = ThemeMatrix.__published__.get((theme, version.to_string()))
+        if segments is not None:
+            # loader uses the segments it published instead of a private copy of the same arrays
+            arrays = ThemeMatrix.__unpack__(segments[0].buf)[0]
+            clusters = ThemeMatrix.__unpack__(segments[1].buf)[0] if len(segments) > 1 else None
+        else:
+            name = ThemeMatrix.segment_name(theme, version)
+            arrays = ThemeMatrix.__attach__(name)
+            if arrays is None:
+                return None
+            clusters = ThemeMatrix.__attach__(name + "-clusters")
+
+        matrix = ThemeMatrix.__from_arrays__(theme, version, arrays)
+        # entities may be not clustered
+        matrix.clusters = ThemeMatrix.__from_arrays__(theme, version, clusters) if clusters is not None else None
+        return matrix
+
+    @staticmethod
+    def __db_stamp__(theme: str, version: Version) -> list:  # list[int] as size and modification time of db
+        db_stat = stat(PathCreator.db(theme, version))
+        return [db_stat.st_size, db_stat.st_mtime_ns]
+
+    @staticmethod
+    def write_compiled(theme: str, version: Version):
+        # arrays of theme version with names and texts written next to its db when version is published,
+        # games map the file instead of building the matrix with SQL queries
+        matrix = ThemeMatrix(theme, version)
+        matrix.__pack_strings__()
+        arrays = matrix.__arrays__()
+        if matrix.clusters is not None:
+            arrays += [("clusters." + name, array) for name, array in matrix.clusters.__arrays__()]
+        size, pieces = ThemeMatrix.__pack__(arrays, {"db": ThemeMatrix.__db_stamp__(theme, version)})
+
+        path = PathCreator.compiled_matrix(theme, version)
+        with open(path + ".tmp", "wb") as file:
+            for offset, piece in pieces:
+                file.seek(offset)
+                file.write(piece)
+            file.truncate(size)
+        replace(path + ".tmp", path)
+
+    @staticmethod
+    def open_compiled(theme: str, version: Version):  # ThemeMatrix or None if not compiled or db changed since
+        path = PathCreator.compiled_matrix(theme, version)
+        if not isfile(path):
+            return None
+
+        # pages are read on first use and shared with other processes mapping the file
+        arrays, info = ThemeMatrix.__unpack__(np.memmap(path, dtype=np.uint8, mode="r"))
+        if info.get("db") != ThemeMatrix.__db_stamp__(theme, version):
+            return None
+
+        matrix = ThemeMatrix.__from_arrays__(theme, version, {name: array for name, array in arrays.items()
+                                                               if not name.startswith("clusters.")})
+        clusters = {name[len("clusters."):]: array for name, array in arrays.items() if name.startswith("clusters.")}
+        matrix.clusters = ThemeMatrix.__from_arrays__(theme, version, clusters) if clusters else None
+        return matrix
+
+    def __cluster_matrix__(self, clusters: list, questions: list, partners: list):  # clusters is list[tuple[id, int]]
+        # cluster of entity at position i is entity_clusters[i]
+        self.entity_clusters, self.cluster_entities, self.cluster_offsets = None, None, None
+        clusters = np.array(clusters, dtype=np.int64).reshape(-1, 2)
+        positions = self.__positions__(self.entity_ids, clusters[:, 0])
+        entity_clusters = np.full(len(self.entity_ids), -1, dtype=np.int64)
+        entity_clusters[positions[positions >= 0]] = clusters[positions >= 0, 1]
+        if len(clusters) == 0 or (entity_clusters < 0).any():
+            # not clustered or entities changed since clustering
+            return None
+
+        # entities of cluster at position i are cluster_entities[cluster_offsets[i]:cluster_offsets[i + 1]]
+        cluster_ids, entity_clusters = np.unique(entity_clusters, return_inverse=True)
+        self.entity_clusters = entity_clusters.reshape(-1).astype(np.int32)
+        self.cluster_entities = np.argsort(self.entity_clusters, kind="stable").astype(np.int32)
+        sizes = np.bincount(self.entity_clusters, minlength=len(cluster_ids))
+        self.cluster_offsets = np.zeros(len(cluster_ids) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.cluster_offsets[1:])
+        for array in (self.entity_clusters, self.cluster_entities, self.cluster_offsets):
+            array.flags.writeable = False
+
+        # answer of cluster is mean answer of its members rounded to the nearest answer value
+        question_count = len(self.question_ids)
+        keys, inverse = np.unique(self.entity_clusters[self.answer_entities].astype(np.int64) * question_count +
+                                  self.answer_questions(), return_inverse=True)
+        means = np.bincount(inverse.reshape(-1), weights=self.answer_levels[self.answer_codes]) / \
+            sizes[keys // question_count]
+        kept = np.abs(means) >= ThemeMatrix.cluster_answer_minimum
+        values = np.where(np.abs(means) >= 0.75, 1.0, 0.5) * np.sign(means)
+        answers = list(zip((keys // question_count)[kept].tolist(),
+                           self.question_ids[keys % question_count][kept].tolist(), values[kept].tolist()))
+
+        # best base rating of members is the base rating of cluster
+        base_ratings = np.full(len(cluster_ids), -np.inf)
+        np.maximum.at(base_ratings, self.entity_clusters, self.base_ratings)
+
+        matrix = ThemeMatrix.__new__(ThemeMatrix)
+        matrix.theme, matrix.version, matrix.path, matrix.shard = self.theme, self.version, self.path, None
+        matrix.__build__(list(enumerate(base_ratings.tolist())), questions, answers, list(), partners)
+        matrix.clusters = None
+        return matrix
+
+    def clustering(self, cluster_count: int = None) -> list:  # list[tuple[int, int]] as entity id and cluster
+        # spherical k-means over answer vectors of entities, square root of entity count clusters by default
+        # entities without answers are a cluster of their own
+        entity_count, question_count = self.entity_count(), self.question_count()
+        rows = np.argsort(self.answer_entities, kind="stable")
+        entities, questions = self.answer_entities[rows], self.entity_answer_splits // 3
+        values = self.answer_levels[self.answer_codes[rows]]
+        norms = np.sqrt(np.bincount(entities, weights=values ** 2, minlength=entity_count))
+        values = (values / norms[entities]).astype(np.float32)
+        answering = np.flatnonzero(norms > 0.0)
+
+        labels = np.full(entity_count, -1, dtype=np.int64)
+        if len(answering) == 0:
+            return list(zip(self.entity_ids.tolist(), [0] * entity_count))
+
+        cluster_count = min(cluster_count or max(int(np.sqrt(entity_count)), 1), len(answering))
+        labels[np.random.default_rng(0).choice(answering, cluster_count, replace=False)] = np.arange(cluster_count)
+        seeded = labels[entities] >= 0
+        centroids = np.zeros((cluster_count, question_count), dtype=np.float32)
+        centroids[labels[entities][seeded], questions[seeded]] = values[seeded]
+
+        # similarities of entities to centroids are summed over their answers in blocks of answers
+        answer_limit = max((1 << 22) // cluster_count, 1)
+        starts = self.entity_offsets[answering]
+        for iteration in range(ThemeMatrix.clustering_iterations):
+            new_labels = np.empty(len(answering), dtype=np.int64)
+            begin = 0
+            while begin < len(answering):
+                end = max(int(np.searchsorted(starts, starts[begin] + answer_limit, side="right")), begin + 1)
+                answers = slice(starts[begin], self.entity_offsets[answering[end - 1] + 1])
+                products = values[answers, np.newaxis] * centroids[:, questions[answers]].T
+                similarities = np.add.reduceat(products, starts[begin:end] - starts[begin], axis=0)
+                new_labels[begin:end] = np.argmax(similarities, axis=1)
+                begin = end
+
+            if (labels[answering] == new_labels).all():
+                break
+            labels[answering] = new_labels
+
+            centroids = np.bincount(labels[entities] * question_count + questions, weights=values,
+                                    minlength=cluster_count * question_count).reshape(cluster_count, -1)
+            lengths = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids = (centroids / np.where(lengths > 0.0, lengths, 1.0)).astype(np.float32)
+
+        labels[labels < 0] = cluster_count
+        return list(zip(self.entity_ids.tolist(), np.unique(labels, return_inverse=True)[1].reshape(-1).tolist()))
+
+    @staticmethod
+    def __inverse__(sorted_ids: np.ndarray) -> np.ndarray:  # positions by id, -1 for missing ids
+        positions = np.full(int(sorted_ids[-1]) + 1 if len(sorted_ids) else 0, -1, dtype=np.int32)
+        positions[sorted_ids] = np.arange(len(sorted_ids), dtype=np.int32)
+        return positions
+
+    @staticmethod
+    def __lookup__(positions: np.ndarray, ids) -> np.ndarray:  # positions of ids, -1 for missing ids
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        known = (ids >= 0) & (ids < len(positions))
+        found = np.full(len(ids), -1, dtype=np.int32)
+        found[known] = positions[ids[known]]
+        return found
+
+    def entity_positions_of(self, ids) -> np.ndarray:  # positions of entities with ids, -1 for missing ones
+        return self.__lookup__(self.entity_positions, ids)
+
+    def question_positions_of(self, ids) -> np.ndarray:  # positions of questions with ids, -1 for missing ones
+        return self.__lookup__(self.question_positions, ids)
+
+    @staticmethod
+    def __positions__(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        if len(sorted_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.searchsorted(sorted_ids, ids)
+        positions[positions >= len(sorted_ids)] = 0
+        return np.where(sorted_ids[positions] == ids, positions, -1)
+
+    def __split_counts__(self, stats: list) -> tuple:  # tuple[np.ndarray, np.ndarray] as split counts and entropies
+        # stats is list[tuple[id, yes, no, answer count, entropy]]
+        stats = np.array(stats, dtype=np.float64).reshape(-1, 5)
+        positions = self.__positions__(self.question_ids, stats[:, 0].astype(np.int64))
+        known = positions >= 0
+        counts = np.zeros((len(self.question_ids), 3), dtype=np.int64)
+        counts[positions[known], 2] = stats[known, 1]
+        counts[positions[known], 0] = stats[known, 2]
+        counts[positions[known], 1] = stats[known, 3] - stats[known, 1] - stats[known, 2]
+        entropies = np.zeros(len(self.question_ids), dtype=np.float64)
+        entropies[positions[known]] = stats[known, 4]
+
+        if not np.array_equal(counts.sum(axis=1), self.question_answer_counts):
+            # no stats or answers changed since they were computed
+            counts = np.bincount(self.entity_answer_splits, minlength=3 * len(self.question_ids)).reshape(-1, 3)
+            entropies = self.__entropies__(counts[:, 2], counts[:, 0], len(self.entity_ids))
+        return counts.reshape(-1), entropies
+
+    @staticmethod
+    def __entropies__(yes: np.ndarray, no: np.ndarray, entity_count: int) -> np.ndarray:
+        # entropy of splitting all entities into yes, no and unknown answers, same as information gains of games
+        # with all entities as candidates
+        entropies = np.zeros(len(yes), dtype=np.float64)
+        splitting = np.flatnonzero(yes + no)
+        shares = np.stack((yes[splitting], no[splitting], entity_count - yes[splitting] - no[splitting]))
+        shares = shares / entity_count
+        with np.errstate(divide="ignore", invalid="ignore"):
+            entropies[splitting] = -np.where(shares > 0.0, shares * np.log2(shares), 0.0).sum(axis=0)
+        return entropies
+
+    def question_stats(self) -> list:  # list[tuple] of question id, yes, no, answer count, entropy
+        splits = np.bincount(self.entity_answer_splits, minlength=3 * self.question_count()).reshape(-1, 3)
+        yes, no = splits[:, 2], splits[:, 0]
+        entropies = self.__entropies__(yes, no, self.entity_count())
+        return list(zip(self.question_ids.tolist(), yes.tolist(), no.tolist(), self.question_answer_counts.tolist(),
+                        entropies.tolist()))
+
+    def entity_count(self) -> int:
+        return len(self.entity_ids)
+
+    def question_count(self) -> int:
+        return len(self.question_ids)
+
+    def answer_count(self) -> int:
+        return len(self.answer_codes)
+
+    def question_answers(self, question: int) -> tuple:  # tuple[entity positions, answer codes]
+        begin, end = self.question_offsets[question], self.question_offsets[question + 1]
+        return self.answer_entities[begin:end], self.answer_codes[begin:end]
+
+    def definite_answers(self, question: int, answer_value: float) -> np.ndarray:  # packed bitset of entities
+        key = question, answer_value
+        bits = self.definite_bits.get(key)
+
+        if bits is None:
+            entities, answer_codes = self.question_answers(question)
+            definite = np.zeros(len(self.entity_ids), dtype=bool)
+            definite[entities[self.answer_levels[answer_codes] == answer_value]] = True
+            bits = np.packbits(definite)
+            bits.flags.writeable = False
+            self.definite_bits[key] = bits
+
+        return bits
+
+    def __strings__(self, table: str, column: str) -> list:  # list[str] in order of positions
+        db = sql_connect(self.path)
+        rows = db.execute(f"SELECT id, {column} FROM {table} ORDER BY id").fetchall()
+        db.close()
+
+        ids = self.entity_ids if table == "entities" else self.question_ids
+        positions = self.__positions__(ids, np.array([row[0] for row in rows], dtype=np.int64))
+        strings = [""] * len(ids)
+        for position, row in zip(positions.tolist(), rows):
+            if position >= 0:
+                strings[position] = row[1]
+        return strings
+
+    @staticmethod
+    def __unpack_strings__(strings: np.ndarray, offsets: np.ndarray, positions) -> list:  # list[str] at positions
+        return [bytes(strings[offsets[position]:offsets[position + 1]]).decode() for position in positions]
+
+    def entity_names_at(self, entities) -> list:  # list[str] of entities at positions
+        if self.entity_name_offsets is not None:
+            return self.__unpack_strings__(self.entity_name_bytes, self.entity_name_offsets, entities)
+        if self.entity_names is None:
+            self.entity_names = self.__strings__("entities", "name")
+        return [self.entity_names[position] for position in entities]
+
+    def question_texts_at(self, questions) -> list:  # list[str] of questions at positions
+        if self.question_text_offsets is not None:
+            return self.__unpack_strings__(self.question_text_bytes, self.question_text_offsets, questions)
+        if self.question_texts is None:
+            self.question_texts = self.__strings__("questions", "text")
+        return [self.question_texts[position] for position in questions]
+
+    @staticmethod
+    def __ranges__(offsets: np.ndarray, items: np.ndarray) -> np.ndarray:
+        begins = offsets[items]
+        lengths = offsets[items + 1] - begins
+        # ranges of all given items concatenated
+        return np.repeat(begins - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    def entity_answers(self, entities: np.ndarray) -> np.ndarray:  # indexes of answers in entity_answer_splits
+        return self.__ranges__(self.entity_offsets, entities)
+
+    def answer_questions(self) -> np.ndarray:  # question positions of answers in column-wise order, not kept
+        return np.repeat(np.arange(self.question_count(), dtype=np.int32), self.question_answer_counts)
+
+    def question_partners_of(self, questions: np.ndarray) -> np.ndarray:  # indexes of partners in partner_* arrays
+        return self.__ranges__(self.partner_offsets, questions)
+
+    def question_partners(self) -> list:  # list[tuple[int, int, float]] as question id, partner id and correlation
+        # cosine similarity of answer vectors of questions, missing answers are 0.0
+        # products are summed over pairs of answers of one entity, in blocks of entities limited by pair count
+        question_count, pair_limit = self.question_count(), 1 << 22
+        rows = np.argsort(self.answer_entities, kind="stable")
+        values = self.answer_levels[self.answer_codes[rows]]
+        row_questions = self.entity_answer_splits // 3
+        norms = np.sqrt(np.bincount(row_questions, weights=values ** 2, minlength=question_count))
+
+        lengths = np.diff(self.entity_offsets)
+        pair_ends = np.cumsum(lengths ** 2)
+        keys, products = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        begin = 0
+        while begin < self.entity_count():
+            end = max(int(np.searchsorted(pair_ends, pair_ends[begin] - lengths[begin] ** 2 + pair_limit,
+                                          side="right")), begin + 1)
+            entities = np.arange(begin, end)
+            # every answer of block paired with all answers of its entity
+            firsts = np.repeat(np.arange(self.entity_offsets[begin], self.entity_offsets[end]),
+                               np.repeat(lengths[entities], lengths[entities]))
+            seconds = self.__ranges__(self.entity_offsets, np.repeat(entities, lengths[entities]))
+            questions, partners = row_questions[firsts], row_questions[seconds]
+            pairs = questions < partners
+            block_keys = questions[pairs].astype(np.int64) * question_count + partners[pairs]
+            keys, inverse = np.unique(np.concatenate((keys, block_keys)), return_inverse=True)
+            products = np.bincount(inverse.reshape(-1), weights=np.concatenate(
+                (products, values[firsts[pairs]] * values[seconds[pairs]])), minlength=len(keys))
+            begin = end
+
+        questions, partners = keys // question_count, keys % question_count
+        correlations = np.clip(products / (norms[questions] * norms[partners]), -1.0, 1.0)
+        kept = (np.abs(correlations) >= ThemeMatrix.partner_correlation) & \
+            (self.question_answer_counts[questions] >= ThemeMatrix.partner_answer_minimum) & \
+            (self.question_answer_counts[partners] >= ThemeMatrix.partner_answer_minimum)
+
+        # both questions of a pair are partners of each other, most correlated ones first
+        questions, partners = (np.concatenate((questions[kept], partners[kept])),
+                               np.concatenate((partners[kept], questions[kept])))
+        correlations = np.concatenate((correlations[kept], correlations[kept]))
+        order = np.lexsort((-np.abs(correlations), questions))
+        questions, partners, correlations = questions[order], partners[order], correlations[order]
+        firsts = np.searchsorted(questions, questions)
+        kept = np.arange(len(questions)) - firsts < ThemeMatrix.partner_count
+
+        return list(zip(self.question_ids[questions[kept]].tolist(), self.question_ids[partners[kept]].tolist(),
+                        correlations[kept].tolist()))
+
+
+# State of one game over a shared ThemeMatrix: ratings vector, used masks and wrong guesses
+# Replaces game connection with its entities_N, questions_N and answers_N tables
+# Arrays are the snapshot's read-only ones until the game first changes them (copy on write)
+class GameEngine():
+    wrong_guess_rating: float = -10000.0
+
+    def __init__(self, theme: str, version: Version, clusters: bool = False, shard: tuple = None):
+        self.theme = theme
+        self.version = version
+        self.snapshot = ThemeMatrix.acquire(theme, version, shard)
+        # game over clusters of snapshot plays them as entities
+        self.matrix = self.snapshot.clusters if clusters else self.snapshot
+
+        self.ratings = self.matrix.base_ratings
+        self.entity_used = self.matrix.no_entities
+        self.question_used = self.matrix.no_questions
+        self.wrong_entities = list()  # list[int]
+        # packed bitset of entities not contradicted by definite answers
+        self.active = self.matrix.all_entity_bits
+        self.__reset_counts__()
+        self.reset_tracking()
+        # changes recorded since start_delta, None when not recording
+        self.entity_changes = None  # list[tuple[positions, old ratings, old used flags]]
+        self.question_changes = None  # list[tuple[positions, old used flags]]
+
+    def reset_tracking(self):
+        # positions of all unused entities rated at least floor, in order, and possibly some other ones
+        # the array shrinks with rising thresholds, so ranking late in a game reads only a few entities
+        self.floor = None
+        self.floor_entities = None
+        self.over_floor = None  # mask of floor_entities
+
+        # extreme ratings of unused entities kept up to date by rating changes, None when not known
+        self.maximum = None
+        self.minimum = None
+
+    def __reset_counts__(self):
+        # per question counters kept between turns and updated by answers of entities that changed since last turn
+        # answers of covered entities are counted in coverage, all of them at the start of a game
+        self.covered = self.matrix.all_entities
+        self.coverage = self.matrix.question_answer_counts
+        # answers of candidates are counted in splits, all entities are candidates at the start of a game
+        self.candidates = self.matrix.all_entities
+        self.splits = self.matrix.question_split_counts
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.release()
+            self.snapshot = None
+            self.matrix = None
+
+    @staticmethod
+    def __writable__(array: np.ndarray) -> np.ndarray:
+        return array if array.flags.writeable else array.copy()
+
+    def dump_state(self) -> tuple:  # tuple[bytes, bytes, bytes] as ratings, used entities and used questions
+        return self.ratings.tobytes(), np.packbits(self.entity_used).tobytes(), np.packbits(self.question_used).tobytes()
+
+    def load_state(self, ratings: bytes, entity_used: bytes, question_used: bytes):
+        # loaded ratings are a read-only buffer and are copied on first write as well
+        self.ratings = np.frombuffer(ratings, dtype=np.float64)
+        self.entity_used = np.unpackbits(np.frombuffer(entity_used, dtype=np.uint8),
+                                         count=self.matrix.entity_count()).view(bool)
+        self.question_used = np.unpackbits(np.frombuffer(question_used, dtype=np.uint8),
+                                           count=self.matrix.question_count()).view(bool)
+        # pruned entities are saved as used ones
+        self.active = np.packbits(~self.entity_used)
+        self.__reset_counts__()
+        self.reset_tracking()
+
+    def start_delta(self):
+        # a turn is undone by restoring the few ratings and flags it changed instead of replaying the game
+        self.entity_changes = list()
+        self.question_changes = list()
+
+    def __remember_entities__(self, positions):
+        if self.entity_changes is not None:
+            positions = np.atleast_1d(positions)
+            self.entity_changes.append((positions, self.ratings[positions], self.entity_used[positions]))
+
+    def __remember_questions__(self, positions):
+        if self.question_changes is not None:
+            positions = np.atleast_1d(positions)
+            self.question_changes.append((positions, self.question_used[positions]))
+
+    def take_delta(self) -> tuple:  # tuple[bytes, bytes, bytes, bytes, bytes] of changed entities and questions
+        # later changes come first, so the oldest value of a position is restored last
+        entity_changes = self.entity_changes[::-1] or [(np.empty(0, np.int32), np.empty(0), np.empty(0, bool))]
+        question_changes = self.question_changes[::-1] or [(np.empty(0, np.int32), np.empty(0, bool))]
+        self.entity_changes = None
+        self.question_changes = None
+
+        positions, ratings, used = (np.concatenate(changes) for changes in zip(*entity_changes))
+        question_positions, question_used = (np.concatenate(changes) for changes in zip(*question_changes))
+        return (positions.astype(np.int32).tobytes(), ratings.astype(np.float64).tobytes(), used.tobytes(),
+                question_positions.astype(np.int32).tobytes(), question_used.tobytes())
+
+    def undo_delta(self, entity_positions: bytes, ratings: bytes, entity_used: bytes,
+                   question_positions: bytes, question_used: bytes):
+        positions = np.frombuffer(entity_positions, dtype=np.int32)
+        if len(positions):
+            self.ratings = self.__writable__(self.ratings)
+            self.entity_used = self.__writable__(self.entity_used)
+            self.ratings[positions] = np.frombuffer(ratings, dtype=np.float64)
+            self.entity_used[positions] = np.frombuffer(entity_used, dtype=bool)
+        positions = np.frombuffer(question_positions, dtype=np.int32)
+        if len(positions):
+            self.question_used = self.__writable__(self.question_used)
+            self.question_used[positions] = np.frombuffer(question_used, dtype=bool)
+
+        self.active = np.packbits(~self.entity_used)
+        self.__reset_counts__()
+        self.reset_tracking()
+
+    def increase_ratings(self, positions: np.ndarray, increases: np.ndarray):
+        self.__remember_entities__(positions)
+        self.ratings = self.__writable__(self.ratings)
+        old_ratings = self.ratings[positions]
+        self.ratings[positions] += increases
+
+        if self.maximum is not None or self.minimum is not None:
+            counted = ~self.entity_used[positions] & (old_ratings > GameEngine.wrong_guess_rating)
+            old_ratings, new_ratings = old_ratings[counted], self.ratings[positions][counted]
+            # an entity holding an extreme has changed: extreme is found again on next use
+            if self.maximum is not None:
+                if (old_ratings == self.maximum).any():
+                    self.maximum = None
+                elif len(new_ratings):
+                    self.maximum = max(self.maximum, new_ratings.max().item())
+            if self.minimum is not None:
+                if (old_ratings == self.minimum).any():
+                    self.minimum = None
+                elif len(new_ratings):
+                    self.minimum = min(self.minimum, new_ratings.min().item())
+
+        if self.floor is not None:
+            # entities risen over the floor join the array
+            risen = positions[~self.over_floor[positions] & (self.ratings[positions] >= self.floor)]
+            if len(risen):
+                self.over_floor[risen] = True
+                self.floor_entities = np.union1d(self.floor_entities, risen)
+
+    def entities_over(self, threshold: float) -> np.ndarray:  # positions of unused entities rated at least threshold
+        if self.floor is None or threshold < self.floor:
+            entities = np.flatnonzero(~self.entity_used & (self.ratings >= threshold))
+            self.over_floor = np.zeros(self.matrix.entity_count(), dtype=bool)
+            self.over_floor[entities] = True
+        else:
+            kept = ~self.entity_used[self.floor_entities] & (self.ratings[self.floor_entities] >= threshold)
+            self.over_floor[self.floor_entities[~kept]] = False
+            entities = self.floor_entities[kept]
+
+        self.floor, self.floor_entities = threshold, entities
+        return entities
+
+    def prune_contradicting(self, question_id: int, answer_value: float):
+        # definite yes or no removes entities with definite opposite answer, they are marked used and are no longer
+        # rated, ranked or counted
+        if answer_value != 1.0 and answer_value != -1.0:
+            return
+
+        question = self.matrix.question_positions_of([question_id])[0]
+        if question < 0:
+            return
+
+        contradicting = self.matrix.definite_answers(question, -answer_value)
+        pruned = self.active & contradicting
+        if not pruned.any():
+            return
+
+        pruned = np.unpackbits(pruned, count=self.matrix.entity_count()).view(bool)
+        self.__remember_entities__(np.flatnonzero(pruned))
+        self.__forget_extremes__(pruned)
+        self.active = self.__writable__(self.active)
+        self.active &= ~contradicting
+        self.entity_used = self.__writable__(self.entity_used)
+        self.entity_used |= pruned
+
+    def keep_clusters(self, clusters: np.ndarray):
+        # entities of other clusters are marked used same as pruned ones
+        kept = np.zeros(len(self.matrix.cluster_offsets) - 1, dtype=bool)
+        kept[clusters] = True
+        dropped = ~kept[self.matrix.entity_clusters]
+
+        self.__remember_entities__(np.flatnonzero(dropped))
+        self.__forget_extremes__(dropped)
+        self.active = self.__writable__(self.active)
+        self.active &= np.packbits(~dropped)
+        self.entity_used = self.__writable__(self.entity_used)
+        self.entity_used |= dropped
+
+    def entities_active(self, positions: np.ndarray) -> np.ndarray:
+        return (self.active[positions >> 3] >> (7 - (positions & 7)) & 1).astype(bool)
+
+    @staticmethod
+    def __known__(positions: np.ndarray, ids) -> np.ndarray:
+        if (positions < 0).any():
+            raise KeyError(np.asarray(ids).reshape(-1)[positions < 0][0].item())
+        return positions
+
+    # games resumed over a newer version may name entities and questions it no longer has: changing them is skipped
+    # same as SQL updates matching no rows, only names and texts of unknown ids raise KeyError
+    @staticmethod
+    def __present__(positions: np.ndarray) -> np.ndarray:
+        return positions[positions >= 0]
+
+    def entity_position(self, id: int) -> int:
+        return self.entity_positions_of([id])[0].item()
+
+    def entity_positions_of(self, ids: list) -> np.ndarray:
+        return self.__known__(self.matrix.entity_positions_of(ids), ids)
+
+    def question_position(self, id: int) -> int:
+        return self.question_positions_of([id])[0].item()
+
+    def question_positions_of(self, ids: list) -> np.ndarray:
+        return self.__known__(self.matrix.question_positions_of(ids), ids)
+
+    def entities_answering_question(self, question_id: int) -> tuple:  # tuple[entity positions, answer codes]
+        question = self.matrix.question_positions_of([question_id])[0]
+        if question < 0:
+            return self.matrix.answer_entities[:0], self.matrix.answer_codes[:0]
+        return self.matrix.question_answers(question)
+
+    def answer_levels(self) -> np.ndarray:
+        return self.matrix.answer_levels
+
+    def __count__(self, answers, divisor: int, size: int) -> np.ndarray:
+        # counts of split keys // divisor of answers (indexes or mask of entity_answer_splits)
+        keys = self.matrix.entity_answer_splits[answers]
+        return np.bincount(keys // divisor if divisor > 1 else keys, minlength=size)
+
+    def __recount__(self, counts: np.ndarray, counted: np.ndarray, counting: np.ndarray,
+                    divisor: int, size: int) -> np.ndarray:
+        # counts of split keys // divisor over answers of counting entities from counts over counted entities
+        changed = np.flatnonzero(counted != counting) if counts is not None else None
+        if changed is not None and len(changed) == 0:
+            return counts
+        if changed is None or 4 * len(changed) > self.matrix.entity_count():
+            return self.__count__(np.repeat(counting, np.diff(self.matrix.entity_offsets)), divisor, size)
+
+        added, removed = changed[counting[changed]], changed[counted[changed]]
+        counts = self.__writable__(counts)
+        counts += self.__count__(self.matrix.entity_answers(added), divisor, size)
+        counts -= self.__count__(self.matrix.entity_answers(removed), divisor, size)
+        return counts
+
+    def question_counts(self, threshold: float) -> np.ndarray:
+        # same as SQL version: answers of entities that are used and under threshold are not counted
+        covered = ~(self.entity_used & (self.ratings < threshold))
+        self.coverage = self.__recount__(self.coverage, self.covered, covered, 3, self.matrix.question_count())
+        self.covered = covered
+        return self.coverage.copy()
+
+    def question_splits(self, threshold: float) -> tuple:  # tuple[yes counts, no counts, candidate count]
+        # answers of unused entities at or above threshold split per question into yes, no and the rest
+        candidates = ~self.entity_used & (self.ratings >= threshold)
+        self.splits = self.__recount__(self.splits, self.candidates, candidates, 1, 3 * self.matrix.question_count())
+        self.candidates = candidates
+
+        splits = self.splits.reshape(-1, 3)
+        return splits[:, 2].copy(), splits[:, 0].copy(), np.count_nonzero(candidates)
+
+    def question_redundancy(self) -> np.ndarray:  # None without question partners
+        # highest absolute correlation of each question with a used one: share of its answers already known
+        partners = self.matrix.question_partners_of(np.flatnonzero(self.question_used))
+        if len(partners) == 0:
+            return None
+
+        redundancy = np.zeros(self.matrix.question_count(), dtype=np.float64)
+        np.maximum.at(redundancy, self.matrix.partner_questions[partners],
+                      np.abs(self.matrix.partner_correlations[partners]))
+        return redundancy
+
+    def question_ids(self, positions: np.ndarray) -> list:  # list[tuple[id]]
+        return [(id,) for id in self.matrix.question_ids[positions].tolist()]
+
+    def question_ratings(self, threshold: float) -> list:  # list[tuple[id]]
+        counts = self.question_counts(threshold)
+        questions = np.flatnonzero(~self.question_used & (counts >= 1))
+        return self.question_ids(questions[np.argsort(-counts[questions], kind="stable")])
+
+    def entity_ratings(self, threshold: float = None, count: int = None) -> list:  # list[tuple[id, rating]]
+        if threshold is None:
+            entities = np.flatnonzero(~self.entity_used)
+        else:
+            entities = self.entities_over(threshold)
+
+        if count is not None and len(entities) > count:
+            if count <= 0:
+                return list()
+            # only the best count entities are sorted, ties at the last rating keep the lowest positions
+            # same as sorting all of them
+            ratings = self.ratings[entities]
+            last = -np.partition(-ratings, count - 1)[count - 1]
+            best = ratings > last
+            best[np.flatnonzero(ratings == last)[:count - np.count_nonzero(best)]] = True
+            entities = entities[best]
+
+        entities = entities[np.argsort(-self.ratings[entities], kind="stable")]
+        return list(zip(self.matrix.entity_ids[entities].tolist(), self.ratings[entities].tolist()))
+
+    def __forget_extremes__(self, positions):
+        # entities at positions are no longer counted
+        ratings = self.ratings[positions]
+        if self.maximum is not None and (ratings == self.maximum).any():
+            self.maximum = None
+        if self.minimum is not None and (ratings == self.minimum).any():
+            self.minimum = None
+
+    def entity_min_max_rating(self) -> tuple:  # tuple[float, float]
+        if self.maximum is None and self.floor is not None:
+            # the highest rating is over any threshold asked for, so it is among the entities over the floor
+            ratings = self.ratings[self.entities_over(self.floor)]
+            ratings = ratings[ratings > GameEngine.wrong_guess_rating]
+            if len(ratings):
+                self.maximum = ratings.max().item()
+
+        if self.maximum is None or self.minimum is None:
+            ratings = self.ratings[~self.entity_used & (self.ratings > GameEngine.wrong_guess_rating)]
+            if len(ratings) == 0:
+                return None, None
+            self.maximum, self.minimum = ratings.max().item(), ratings.min().item()
+
+        return self.maximum, self.minimum
+
+    def entity_get_name(self, id: int) -> str:
+        return self.matrix.entity_names_at([self.entity_position(id)])[0]
+
+    def entity_get_names(self, ids: list) -> list:  # list[str]
+        return self.matrix.entity_names_at(self.entity_positions_of(ids).tolist())
+
+    def question_get_text(self, id: int) -> str:
+        return self.matrix.question_texts_at([self.question_position(id)])[0]
+
+    def question_get_texts(self, ids: list) -> list:  # list[str]
+        return self.matrix.question_texts_at(self.question_positions_of(ids).tolist())
+
+    def entity_set_used(self, id: int):
+        position = self.__present__(self.matrix.entity_positions_of([id]))
+        self.__remember_entities__(position)
+        self.__forget_extremes__(position)
+        self.entity_used = self.__writable__(self.entity_used)
+        self.entity_used[position] = True
+
+    def question_set_used(self, id: int):
+        self.questions_set_used([id])
+
+    def questions_set_used(self, ids: list):
+        positions = self.__present__(self.matrix.question_positions_of(ids))
+        self.__remember_questions__(positions)
+        self.question_used = self.__writable__(self.question_used)
+        self.question_used[positions] = True
+
+    def entities_set_wrong(self, ids: list):
+        positions = self.__present__(self.matrix.entity_positions_of(ids))
+        self.__remember_entities__(positions)
+        self.__forget_extremes__(positions)
+        self.ratings = self.__writable__(self.ratings)
+        self.entity_used = self.__writable__(self.entity_used)
+        self.ratings[positions] = GameEngine.wrong_guess_rating
+        self.entity_used[positions] = True
+        self.wrong_entities.extend(ids)
+
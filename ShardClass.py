@@ -0,0 +1,279 @@
+import numpy as np
+from multiprocessing import Process, Pipe
+from VersionClass import Version
+from MyError import MyError, MyErrorType
+from EngineClass import ThemeMatrix, GameEngine
+
+
+def shard_entities(game: GameEngine, ids: list) -> list:  # list[int] of ids of entities of the shard of game
+    return [id for id, position in zip(ids, game.matrix.entity_positions_of(ids).tolist()) if position >= 0]
+
+
+def shard_command(game: GameEngine, command: str, args: tuple):  # result of command of game
+    from Akinator import GivenAnswer
+
+    if command == "increase_rating":
+        algorithms, question_id, answer_value, threshold = args
+        algorithms.increase_rating(game, GivenAnswer(question_id, answer_value), threshold)
+        return None
+    elif command == "increasemany_rating":
+        algorithms, given_answers = args
+        algorithms.increasemany_rating(game, given_answers)
+        return None
+    elif command == "question_counts":
+        return game.question_counts(*args)
+    elif command == "question_splits":
+        return game.question_splits(*args)
+    elif command == "question_redundancy":
+        return game.question_redundancy()
+    elif command == "entity_min_max_rating":
+        return game.entity_min_max_rating()
+    elif command == "entity_ratings":
+        return game.entity_ratings(*args)
+    elif command == "entity_get_names":
+        # only names of entities of this shard
+        ids = shard_entities(game, args[0])
+        return dict(zip(ids, game.entity_get_names(ids)))
+    elif command == "entities_set_used":
+        for id in shard_entities(game, args[0]):
+            game.entity_set_used(id)
+        return None
+    elif command == "questions_set_used":
+        game.questions_set_used(*args)
+        return None
+    elif command == "entities_set_wrong":
+        game.entities_set_wrong(shard_entities(game, args[0]))
+        return None
+    raise ShardPool.Error(ShardPool.Error.Type.unknown_command, command)
+
+
+def serve_shard(connection, theme: str, version: Version, index: int, count: int):
+    # worker process of ShardPool: games over one shard of theme entities, commands are answered in order
+    from Akinator import AkinationAlgorithms
+
+    games = dict()  # dict[int, GameEngine]
+    matrix = ThemeMatrix.acquire(theme, version, (index, count))
+    # every shard has all questions, the first one sends their texts
+    connection.send((matrix.entity_count(), matrix.question_ids,
+                     matrix.question_texts_at(range(matrix.question_count())) if index == 0 else None))
+
+    while True:
+        command, game_id, args = connection.recv()
+        try:
+            if command == "stop":
+                break
+            elif command == "start":
+                # class settings of the pool's process are not inherited by spawned workers
+                AkinationAlgorithms.prune_contradictions = args[0]
+                games[game_id] = GameEngine(theme, version, shard=(index, count))
+                result = None
+            elif command == "close":
+                games.pop(game_id).close()
+                result = None
+            elif command == "batch":
+                # commands of a turn sent in one message: results of all of them in order
+                result = [shard_command(games[game_id], *turn_command) for turn_command in args[0]]
+            else:
+                result = shard_command(games[game_id], command, args)
+        except Exception as error:
+            result = error
+        connection.send(result)
+
+    for game in games.values():
+        game.close()
+    matrix.release()
+    connection.close()
+
+
+# Worker processes each holding an equal part of entities of one theme version in order of ids
+# Answers are applied by all workers at once, their partial results are merged by ShardedGame
+class ShardPool():
+    class Error(MyError):
+        class Type(MyErrorType):
+            unknown_command = "Shard worker does not know the command"
+            pool_stopped = "Shard pool is already stopped"
+            unsharded_algorithms = "Only AkinationAlgorithms can score games over shards"
+
+        def __init__(self, error_type: Type, command: str = None):
+            MyError.__init__(self, error_type, info={"command": command} if command is not None else None)
+
+        def __str__(self) -> str:
+            return MyError.__str__(self)
+
+    # games of theme versions with at least entity_minimum entities are played over shards, None for no games:
+    # on the host measured by test_shards, a turn over shards was slower than in one process at every theme size
+    entity_minimum: int = None
+
+    def __init__(self, theme: str, version: Version, shard_count: int):
+        self.theme = theme
+        self.version = version
+        self.connections = list()
+        self.processes = list()
+        for index in range(shard_count):
+            connection, worker_connection = Pipe()
+            process = Process(target=serve_shard, args=(worker_connection, theme, version, index, shard_count),
+                              daemon=True)
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        # every shard has all questions of theme version, texts are kept here so asking a question needs no message
+        shards = [connection.recv() for connection in self.connections]
+        self.entity_count = sum(shard[0] for shard in shards)
+        self.question_ids, question_texts = shards[0][1:]
+        self.question_texts = dict(zip(self.question_ids.tolist(), question_texts))
+        self.game_count = 0
+
+    def shard_count(self) -> int:
+        return len(self.connections)
+
+    def serves(self) -> bool:
+        return ShardPool.entity_minimum is not None and self.entity_count >= ShardPool.entity_minimum
+
+    def call(self, command: str, game_id: int, args: tuple = (), shards: list = None) -> list:
+        # results of command of all (or some) shards in order of shards, sent to all of them before waiting
+        if not self.processes:
+            raise self.Error(self.Error.Type.pool_stopped, command)
+
+        connections = self.connections if shards is None else [self.connections[shard] for shard in shards]
+        for connection in connections:
+            connection.send((command, game_id, args))
+        results = [connection.recv() for connection in connections]
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def start_game(self) -> int:
+        from Akinator import AkinationAlgorithms
+
+        self.game_count += 1
+        self.call("start", self.game_count, (AkinationAlgorithms.prune_contradictions,))
+        return self.game_count
+
+    def stop(self):
+        for connection, process in zip(self.connections, self.processes):
+            connection.send(("stop", None, ()))
+            process.join()
+            connection.close()
+        self.connections.clear()
+        self.processes.clear()
+
+
+# One game over all shards of a ShardPool: same results as GameEngine over the whole theme version for
+# AkinationAlgorithms, shards being in order of entity positions keeps ties of ratings in the same order
+# Commands changing the game are sent with the next one having results, so a turn sends one message to every
+# shard for its extremes and one for everything ranked at the threshold between them
+class ShardedGame():
+    def __init__(self, pool: ShardPool):
+        self.pool = pool
+        self.theme = pool.theme
+        self.version = pool.version
+        self.game_id = pool.start_game()
+
+        # questions of theme version in order of positions
+        self.questions = pool.question_ids
+        self.question_used = np.zeros(len(self.questions), dtype=bool)
+
+        # commands changing the game not sent yet: list[tuple[str, tuple]]
+        self.changes = list()
+        # results of every shard ranked at one threshold since the last change: tuple[threshold, count, list] or None
+        self.ranked = None
+
+    def close(self):
+        if self.pool is not None:
+            if self.pool.processes:
+                self.pool.call("close", self.game_id)
+            self.pool = None
+
+    def __change__(self, command: str, args: tuple):
+        self.changes.append((command, args))
+        self.ranked = None
+
+    def __send__(self, commands: list) -> list:  # list[list] as results of commands of every shard
+        # changes are applied by shards before commands
+        results = self.pool.call("batch", self.game_id, (self.changes + commands,))
+        self.changes = list()
+        return [shard[len(shard) - len(commands):] for shard in results]
+
+    def __rank__(self, threshold: float, count: int = 0) -> list:  # list[list] as results of every shard
+        # entities and questions are ranked at the same threshold in a turn: everything of it is asked at once,
+        # questions ranked without entities come with none of them
+        if self.ranked is None or self.ranked[:2] != (threshold, count):
+            self.ranked = threshold, count, self.__send__([("entity_ratings", (threshold, count)),
+                                                           ("question_counts", (threshold,)),
+                                                           ("question_splits", (threshold,)),
+                                                           ("question_redundancy", ())])
+        return self.ranked[2]
+
+    def increase_rating(self, algorithms, question_id: int, answer_value: float, threshold: float):
+        self.__change__("increase_rating", (algorithms, question_id, answer_value, threshold))
+
+    def increasemany_rating(self, algorithms, given_answers: list):  # list[tuple[int, float]]
+        self.__change__("increasemany_rating", (algorithms, given_answers))
+
+    def question_counts(self, threshold: float) -> np.ndarray:
+        if self.ranked is None or self.ranked[0] != threshold:
+            self.__rank__(threshold)
+        return np.sum([shard[1] for shard in self.ranked[2]], axis=0)
+
+    def question_splits(self, threshold: float) -> tuple:  # tuple[yes counts, no counts, candidate count]
+        if self.ranked is None or self.ranked[0] != threshold:
+            self.__rank__(threshold)
+        splits = [shard[2] for shard in self.ranked[2]]
+        return tuple(sum(split[i] for split in splits) for i in range(3))
+
+    def question_redundancy(self) -> np.ndarray:  # None without question partners
+        # every shard has all question partners
+        if self.ranked is not None:
+            return self.ranked[2][0][3]
+        return self.__send__([("question_redundancy", ())])[0][0]
+
+    def question_ids(self, positions: np.ndarray) -> list:  # list[tuple[id]]
+        return [(id,) for id in self.questions[positions].tolist()]
+
+    def entity_ratings(self, threshold: float = None, count: int = None) -> list:  # list[tuple[id, rating]]
+        # best count entities of every shard contain the best count ones of all of them
+        shards = self.__rank__(threshold, count) if threshold is not None else \
+            self.__send__([("entity_ratings", (threshold, count))])
+        ratings = [rating for shard in shards for rating in shard[0]]
+        ratings.sort(key=lambda rating: -rating[1])
+        return ratings if count is None else ratings[:max(count, 0)]
+
+    def entity_min_max_rating(self) -> tuple:  # tuple[float, float]
+        extremes = [shard[0] for shard in self.__send__([("entity_min_max_rating", ())]) if shard[0][0] is not None]
+        if not extremes:
+            return None, None
+        return max(extreme[0] for extreme in extremes), min(extreme[1] for extreme in extremes)
+
+    def entity_get_name(self, id: int) -> str:
+        return self.entity_get_names([id])[0]
+
+    def entity_get_names(self, ids: list) -> list:  # list[str]
+        names = dict()
+        for shard in self.__send__([("entity_get_names", (ids,))]):
+            names.update(shard[0])
+        return [names[id] for id in ids]
+
+    def question_get_text(self, id: int) -> str:
+        return self.pool.question_texts[id]
+
+    def question_get_texts(self, ids: list) -> list:  # list[str]
+        return [self.pool.question_texts[id] for id in ids]
+
+    def entity_set_used(self, id: int):
+        self.__change__("entities_set_used", ([id],))
+
+    def question_set_used(self, id: int):
+        self.questions_set_used([id])
+
+    def questions_set_used(self, ids: list):
+        # unknown ids are skipped same as by GameEngine
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        positions = np.minimum(np.searchsorted(self.questions, ids), len(self.questions) - 1)
+        self.question_used[positions[self.questions[positions] == ids]] = True
+        self.__change__("questions_set_used", (ids,))
+
+    def entities_set_wrong(self, ids: list):
+        self.__change__("entities_set_wrong", (ids,))
@@ -4,7 +4,8 @@ from telegram.message import Message
 from telegram.ext import Updater, CommandHandler, MessageHandler, PollAnswerHandler, Filters, CallbackContext
 from Stats import StatsManager
 from Akinator import AkinatorState
-from BotAkinator import BotAkinator
+from BotAkinator import BotAkinator, BotSessions
+from EngineClass import ThemeMatrix
 from bot_db import BotDB
 from enum import Enum
 from VersionClass import Version
@@ -126,12 +127,14 @@ class BotCommandHandler():
             db.add_user(Bot.id_from_update(update, context), PossibleActions.start.value)
         except IntegrityError:  # the user already exists
             db.clear_whole_session(Bot.id_from_update(update, context), PossibleActions.start.value)
+            BotSessions.discard(Bot.id_from_update(update, context))
         db.close()
 
     @staticmethod
     def stop(update: Update, context: CallbackContext):
         db = BotDB()
         db.clear_whole_session(Bot.id_from_update(update, context), PossibleActions.start.value)
+        BotSessions.discard(Bot.id_from_update(update, context))
         db.close()
 
     @staticmethod
@@ -544,6 +547,8 @@ class BotPollAnswerHandler():
             BotUserAnswerHandler.ask_update(update, context)
 
 
+        # engine of chat stays alive for its next turn
+        akinator.release()
         # Save some info about the poll in the bot_data for later use in poll_answer
         context.bot_data.update(payload)
         bot_db.close()
@@ -720,8 +725,20 @@ class Bot(Updater):
         update.message.reply_poll("Click 'START' whenever you are ready", ["START"])
 
     def main(self):
-        self.start_polling()
-        self.idle()
+        # latest versions are put to shared memory: games of the bot use them and other processes of the host
+        # (shard workers, other bots) attach them instead of loading each of them
+        for theme in available_themes():
+            try:
+                ThemeMatrix.publish(theme, latest_version(theme))
+            except ThemeMatrix.Error as error:
+                self.logger.warning('Theme "%s" is not published: %s', theme, error)
+        try:
+            self.start_polling()
+            self.idle()
+        finally:
+            # segments are not unlinked by attached processes, they would stay after the bot exits
+            for theme in available_themes():
+                ThemeMatrix.unpublish(theme)
 
 
 # for testing
@@ -742,7 +759,8 @@ if __name__ == "__main__":
     # clear user data
     bot_db = BotDB()
     #bot_db.drop()
-    #bot_db.create_tables()
+    # creates tables added since the data base was made
+    bot_db.create_tables()
     bot_db.close()
 
     bot = Bot()
@@ -10,6 +10,8 @@ class BotDB(Connection):
         self.execute(f"CREATE TABLE IF NOT EXISTS {Layouts.Table.users.value}")
         self.execute(f"CREATE TABLE IF NOT EXISTS {Layouts.Table.given_answers.value}")
         self.execute(f"CREATE TABLE IF NOT EXISTS {Layouts.Table.wrong_guesses.value}")
+        self.execute(f"CREATE TABLE IF NOT EXISTS {Layouts.Table.game_states.value}")
+        self.execute(f"CREATE TABLE IF NOT EXISTS {Layouts.Table.game_deltas.value}")
         # UPDATES TO MAIN DB
         self.execute(f"CREATE TABLE IF NOT EXISTS {Layouts.Table.updates.value}")
         self.execute(f"CREATE TABLE IF NOT EXISTS {Layouts.Table.entity_updates.value}")
@@ -133,6 +135,10 @@ class BotDB(Connection):
     def get_given_answers_dict(self, chat_id: int, columns=("chat_id", "question_id", "answer_value")) -> list:
         return BotDB.__list_of_dict_from_queries__(columns, self.get_given_answers(chat_id, columns))
 
+    def get_given_answers_since(self, chat_id: int, count: int, columns=("question_id", "answer_value")) -> list:
+        return self.execute(f"SELECT {BotDB.__column_string__(columns)} FROM given_answers WHERE chat_id==? "
+                            "ORDER BY rowid LIMIT -1 OFFSET ?", (chat_id, count)).fetchall()
+
     def add_given_answer(self, chat_id: int, answer_value: float):
         self.execute("INSERT INTO given_answers(chat_id, question_id, answer_value) "
                      "VALUES(?, (SELECT id_in_poll FROM users WHERE chat_id==?), ?)",
@@ -140,9 +146,8 @@ class BotDB(Connection):
         self.update_session_date(chat_id)
 
     def remove_last_given_answer(self, chat_id: int):
-        subquery = "SELECT question_id FROM given_answers WHERE chat_id==? ORDER BY column DESC LIMIT 1"
-        self.execute(f"DELETE FROM given_answers WHERE chat_id==? AND question_id==({subquery})",
-                     (chat_id, chat_id))
+        subquery = "SELECT rowid FROM given_answers WHERE chat_id==? ORDER BY rowid DESC LIMIT 1"
+        self.execute(f"DELETE FROM given_answers WHERE rowid==({subquery})", (chat_id,))
         self.update_session_date(chat_id)
 
     #
@@ -153,6 +158,10 @@ class BotDB(Connection):
     def get_wrong_guesses_dict(self, chat_id: int, columns=("chat_id", "entity_id")) -> list:
         return BotDB.__list_of_dict_from_queries__(columns, self.get_wrong_guesses(chat_id, columns))
 
+    def get_wrong_guesses_since(self, chat_id: int, count: int, columns=("entity_id",)) -> list:
+        return self.execute(f"SELECT {BotDB.__column_string__(columns)} FROM wrong_guesses WHERE chat_id==? "
+                            "ORDER BY rowid LIMIT -1 OFFSET ?", (chat_id, count)).fetchall()
+
     def add_wrong_guess(self, chat_id: int):
         self.execute("INSERT INTO wrong_guesses(chat_id, entity_id) "
                      "VALUES(?, (SELECT id_in_poll FROM users WHERE chat_id==?))",
@@ -160,11 +169,49 @@ class BotDB(Connection):
         self.update_session_date(chat_id)
 
     def remove_last_wrong_guess(self, chat_id: int):
-        subquery = "SELECT entity_id FROM wrong_guesses WHERE chat_id==? ORDER BY column DESC LIMIT 1"
-        self.execute(f"DELETE FROM wrong_guesses WHERE chat_id==? AND entity_id==({subquery})",
-                     (chat_id, chat_id))
+        subquery = "SELECT rowid FROM wrong_guesses WHERE chat_id==? ORDER BY rowid DESC LIMIT 1"
+        self.execute(f"DELETE FROM wrong_guesses WHERE rowid==({subquery})", (chat_id,))
         self.update_session_date(chat_id)
 
+    #
+    # game_states table
+    def get_game_state(self, chat_id: int) -> tuple:
+        return self.__select__("game_states", chat_id,
+                               ["theme", "version", "answer_count", "wrong_guess_count",
+                                "ratings", "entity_used", "question_used"]).fetchone()
+
+    def get_game_state_counts(self, chat_id: int) -> tuple:
+        return self.__select__("game_states", chat_id,
+                               ["theme", "version", "answer_count", "wrong_guess_count"]).fetchone()
+
+    def save_game_state(self, chat_id: int, theme: str, version: str, answer_count: int, wrong_guess_count: int,
+                        ratings: bytes, entity_used: bytes, question_used: bytes):
+        self.execute("INSERT OR REPLACE INTO game_states(chat_id, theme, version, answer_count, wrong_guess_count, "
+                     "ratings, entity_used, question_used) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                     (chat_id, theme, version, answer_count, wrong_guess_count, ratings, entity_used, question_used))
+
+    def remove_game_state(self, chat_id: int):
+        self.execute("DELETE FROM game_states WHERE chat_id==?", (chat_id,))
+        self.execute("DELETE FROM game_deltas WHERE chat_id==?", (chat_id,))
+
+    #
+    # game_deltas table
+    def add_game_delta(self, chat_id: int, answer_count: int, wrong_guess_count: int, entity_positions: bytes,
+                       ratings: bytes, entity_used: bytes, question_positions: bytes, question_used: bytes):
+        self.execute("INSERT INTO game_deltas(chat_id, answer_count, wrong_guess_count, entity_positions, ratings, "
+                     "entity_used, question_positions, question_used) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                     (chat_id, answer_count, wrong_guess_count, entity_positions, ratings, entity_used,
+                      question_positions, question_used))
+
+    def get_last_game_delta(self, chat_id: int) -> tuple:
+        return self.execute("SELECT answer_count, wrong_guess_count, entity_positions, ratings, entity_used, "
+                            "question_positions, question_used FROM game_deltas WHERE chat_id==? "
+                            "ORDER BY rowid DESC LIMIT 1", (chat_id,)).fetchone()
+
+    def remove_last_game_delta(self, chat_id: int):
+        subquery = "SELECT rowid FROM game_deltas WHERE chat_id==? ORDER BY rowid DESC LIMIT 1"
+        self.execute(f"DELETE FROM game_deltas WHERE rowid==({subquery})", (chat_id,))
+
     def victory(self, chat_id: int):
         self.execute("UPDATE users SET state=4, session_date=? WHERE chat_id==?",
                      (datetime.now(), chat_id))
@@ -201,6 +248,7 @@ class BotDB(Connection):
                      (last_action, None, datetime.now(), chat_id))
         self.execute("DELETE FROM given_answers WHERE chat_id=?", (chat_id,))
         self.execute("DELETE FROM wrong_guesses WHERE chat_id=?", (chat_id,))
+        self.remove_game_state(chat_id)
         self.update_last_session_and_last_action(chat_id, last_action)
         # self.commit()
 
@@ -216,6 +264,7 @@ class BotDB(Connection):
     def clear_whole_session(self, chat_id: int, last_action: str):
         self.execute("DELETE FROM given_answers WHERE chat_id=?", (chat_id,))
         self.execute("DELETE FROM wrong_guesses WHERE chat_id=?", (chat_id,))
+        self.remove_game_state(chat_id)
         self.execute("DELETE FROM new_answers WHERE chat_id==?", (chat_id,))
         self.execute("DELETE FROM new_questions WHERE chat_id==?", (chat_id,))
         self.execute("DELETE FROM new_entities WHERE chat_id==?", (chat_id,))
@@ -15,10 +15,22 @@ class PathCreator():
     def db(theme: str, version: Version) -> str:
         return f"./data/{theme}/{version.to_string()}/file.db"
 
+    @staticmethod
+    def compiled_matrix(theme: str, version: Version) -> str:
+        return f"./data/{theme}/{version.to_string()}/matrix.bin"
+
     @staticmethod
     def db_stats(theme: str, version: Version) -> str:
         return f"./data/{theme}/{version.to_string()}/stats.json"
 
+    @staticmethod
+    def opening_book(theme: str, version: Version) -> str:
+        return f"./data/{theme}/{version.to_string()}/opening_book.json"
+
+    @staticmethod
+    def theme_config(theme: str) -> str:
+        return f"./data/{theme}/theme_config.json"
+
     @staticmethod
     def theme_stats(theme: str) -> str:
         return f"./data/{theme}/theme_stats.json "
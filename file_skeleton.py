@@ -72,6 +72,28 @@ class Layouts():
             entity_id INTEGER NOT NULL,
             FOREIGN KEY(chat_id) REFERENCES users(chat_id)
         )"""
+        game_states = """game_states(
+            chat_id INTEGER PRIMARY KEY,
+            theme TEXT NOT NULL,
+            version TEXT NOT NULL,
+            answer_count INTEGER(0) NOT NULL,
+            wrong_guess_count INTEGER(0) NOT NULL,
+            ratings BLOB NOT NULL,
+            entity_used BLOB NOT NULL,
+            question_used BLOB NOT NULL,
+            FOREIGN KEY(chat_id) REFERENCES users(chat_id)
+        )"""
+        game_deltas = """game_deltas(
+            chat_id INTEGER NOT NULL,
+            answer_count INTEGER(0) NOT NULL,
+            wrong_guess_count INTEGER(0) NOT NULL,
+            entity_positions BLOB NOT NULL,
+            ratings BLOB NOT NULL,
+            entity_used BLOB NOT NULL,
+            question_positions BLOB NOT NULL,
+            question_used BLOB NOT NULL,
+            FOREIGN KEY(chat_id) REFERENCES users(chat_id)
+        )"""
 
         # BOT UPDATES TO ENTITY DB TABLES
         updates = """updates(
@@ -147,6 +169,26 @@ class Layouts():
             FOREIGN KEY(question_id) REFERENCES questions(id)
             CONSTRAINT id PRIMARY KEY(entity_id, question_id)
         )"""
+        question_stats = """question_stats (
+            question_id INTEGER PRIMARY KEY,
+            yes_count INTEGER NOT NULL,
+            no_count INTEGER NOT NULL,
+            answer_count INTEGER NOT NULL,
+            entropy FLOAT NOT NULL,
+            FOREIGN KEY(question_id) REFERENCES questions(id)
+        )"""
+        entity_clusters = """entity_clusters (
+            entity_id INTEGER PRIMARY KEY,
+            cluster INTEGER NOT NULL,
+            FOREIGN KEY(entity_id) REFERENCES entities(id)
+        )"""
+        question_partners = """question_partners (
+            question_id INTEGER NOT NULL,
+            partner_id INTEGER NOT NULL,
+            correlation FLOAT NOT NULL CHECK(correlation>=-1.0 AND correlation<=1.0),
+            FOREIGN KEY(question_id) REFERENCES questions(id),
+            FOREIGN KEY(partner_id) REFERENCES questions(id)
+        )"""
 
         @staticmethod
         def entities_game(connection_id: int) -> str:
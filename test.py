@@ -48,6 +48,9 @@ from data_generation import DataGenerator
 from random import randrange, randint
 from Akinator import AkinationAlgorithms, GivenAnswer, Akinator, AkinatorState
 from pandas import read_sql_query, option_context
+import numpy as np
+from sqlite3 import connect as sql_connect
+from file_management import PathCreator
 
 
 def main(entity_count: int = 100000):
@@ -98,10 +101,7 @@ def test_creation_time(step: int, count: int):
 
 
 def akinate(db: Connection):
-    from pandas import read_sql_query
-
-    akinator = Akinator(db.theme, db.version, db.connection_type)
-    print(f"AKINATOR ID: {akinator.db.id}")
+    akinator = Akinator(db.theme, db.version)
 
     while akinator.state != AkinatorState.GiveUp and akinator.state != AkinatorState.Victory:
         akinator.next_state()
@@ -113,8 +113,7 @@ def akinate(db: Connection):
             answer = float(input("ANSWER: "))
             akinator.receive_answer(id, answer)
 
-            print("DB:", read_sql_query(f"SELECT id, rating FROM entities_{akinator.db.id} "
-                                        f"WHERE used=0 AND rating>={akinator.compute_threshold - 1.0}", akinator.db), "\n")
+            print("DB:", akinator.db.entity_ratings(akinator.compute_threshold - 1.0), "\n")
 
         elif akinator.state == AkinatorState.MakeGuess:
             id, name = akinator.guess()
@@ -203,8 +202,233 @@ def test_game_connection():
     #print(db)
 
 
+def test_rating_increase_table(theme: str = "test", version: Version = Version(1, 3)) -> bool:
+    from EngineClass import GameEngine
+
+    true_values = [1.0, 0.5, 0.0, -0.5, -1.0]
+    table = AkinationAlgorithms.rating_increase_table(np.array(true_values))
+    for i, true_answer in enumerate(true_values):
+        for j, given_answer in enumerate(AkinationAlgorithms.given_answer_values):
+            if table[i, j] != AkinationAlgorithms.get_rating_increase(true_answer, given_answer):
+                return False
+
+    engine = GameEngine(theme, version)
+    questions = engine.matrix.question_ids.tolist()
+    given_answers = [(id, AkinationAlgorithms.given_answer_values[randrange(5)]) for id in questions[:5]]
+    AkinationAlgorithms.increasemany_rating(engine, given_answers)
+
+    same = True
+    parent_db = sql_connect(engine.matrix.path)
+    for id, rating in engine.entity_ratings():
+        true_answers = parent_db.execute("SELECT question_id, answer_value FROM answers "
+                                         "WHERE entity_id=? ORDER BY rowid", (id,)).fetchall()
+        base_rating = engine.matrix.base_ratings[engine.entity_position(id)]
+        same &= rating == base_rating + AkinationAlgorithms.get_rating_increasemany(true_answers, given_answers)
+
+    parent_db.close()
+    engine.close()
+    return same
+
+
+def test_min_max_rating(theme: str = "test", version: Version = Version(1, 3), step_count: int = 300) -> bool:
+    # extreme ratings kept by a game engine against MIN and MAX of a sql game after random answers, guesses and
+    # thresholds, version has one answer per entity and question as sql games sum all of them
+    from EngineClass import GameEngine
+    from BotAkinator import BotAkinator
+
+    engine = GameEngine(theme, version)
+    game_db = Connection(Connection.Type.game, theme, version)
+    questions = engine.matrix.question_ids.tolist()
+    entities = engine.matrix.entity_ids.tolist()
+
+    same = True
+    for step in range(step_count):
+        operation = randrange(4)
+        if operation == 0:
+            given_answers = [(questions[randrange(len(questions))], AkinationAlgorithms.given_answer_values[randrange(5)])
+                             for i in range(randint(1, 3))]
+            AkinationAlgorithms.increasemany_rating(engine, given_answers)
+            AkinationAlgorithms.increasemany_rating(game_db, given_answers)
+        elif operation == 1:
+            id = entities[randrange(len(entities))]
+            engine.entity_set_used(id)
+            game_db.entity_set_used(id)
+        elif operation == 2:
+            id = entities[randrange(len(entities))]
+            engine.entities_set_wrong([id])
+            # wrong guesses of a game engine are used entities keeping wrong_guess_rating
+            game_db.update_entity_ratings([(GameEngine.wrong_guess_rating, id)])
+            game_db.entity_set_used(id)
+        else:
+            # thresholds move the rating floor the maximum is searched over
+            maximum, minimum = engine.entity_min_max_rating()
+            if maximum is not None:
+                engine.entities_over(BotAkinator.get_compute_threshold(maximum, minimum,
+                                                                       BotAkinator.start_guess_threshold))
+
+        maximum, minimum = engine.entity_min_max_rating()
+        sql_maximum, sql_minimum = game_db.entity_min_max_rating()
+        if maximum is None or sql_maximum is None:
+            same &= maximum is None and sql_maximum is None
+        else:
+            same &= bool(np.isclose(maximum, sql_maximum) and np.isclose(minimum, sql_minimum))
+
+    game_db.close()
+    engine.close()
+    return same
+
+
+def same_game_states(first: tuple, second: tuple) -> bool:
+    # game states of dump_state, ratings summed in another order may differ in the last bits
+    return np.allclose(np.frombuffer(first[0]), np.frombuffer(second[0])) and first[1:] == second[1:]
+
+
+def test_game_deltas(theme: str = "test", version: Version = Version(1, 2), entity_ids: tuple = (1, 5, 17, 100),
+                     chat_id: int = -1) -> bool:
+    # answers and wrong guesses taken back with /back are undone by saved deltas of their turns,
+    # the game state left is the same as replaying the remaining history from the start
+    from EngineClass import GameEngine
+    from BotAkinator import BotAkinator
+    from bot_db import BotDB
+    from sqlite3 import IntegrityError
+
+    # positions changed twice in a turn get back their value from before the turn
+    game = GameEngine(theme, version)
+    questions = game.matrix.question_ids[:2].tolist()
+    AkinationAlgorithms.increasemany_rating(game, [(questions[0], 1.0)])
+    before = game.dump_state()
+    game.start_delta()
+    AkinationAlgorithms.increasemany_rating(game, [(questions[1], 1.0), (questions[1], -0.5)])
+    game.questions_set_used([questions[1], questions[1]])
+    leader = game.entity_ratings(count=1)[0][0]
+    game.entities_set_wrong([leader])
+    game.entities_set_wrong([leader])
+    game.undo_delta(*game.take_delta())
+    same = game.dump_state() == before
+    game.close()
+
+    bot_db = BotDB()
+    bot_db.create_tables()
+    try:
+        bot_db.add_user(chat_id, "start")
+    except IntegrityError:  # the user already exists
+        pass
+    theme_db = sql_connect(PathCreator.db(theme, version))
+
+    for entity_id in entity_ids:
+        answers = dict(theme_db.execute("SELECT question_id, answer_value FROM answers WHERE entity_id==?",
+                                        (entity_id,)).fetchall())
+        bot_db.clear_game_session(chat_id, "ask_question")
+        bot_db.set_theme(chat_id, "ask_theme", theme)
+
+        for turn in range(BotAkinator.iteration_limit + BotAkinator.guess_limit):
+            akinator = BotAkinator(theme, version, chat_id)
+            if akinator.state == AkinatorState.AskQuestion:
+                id = akinator.ask_question()[0]
+                bot_db.save_akinator_loop(chat_id, "ask_question", akinator.iteration, akinator.state, id)
+                # a wrong answer is given, applied and taken back
+                answer_value = answers.get(id, 0.0)
+                bot_db.add_given_answer(chat_id, -1.0 if answer_value > 0.0 else 1.0)
+                BotAkinator(theme, version, chat_id)
+                bot_db.remove_last_given_answer(chat_id)
+            elif akinator.state in (AkinatorState.MakeGuess, AkinatorState.MakeLastGuess):
+                id = akinator.guess()[0] if akinator.state == AkinatorState.MakeGuess else akinator.last_guess()[0]
+                bot_db.save_akinator_loop(chat_id, "guess", akinator.iteration, akinator.state, id)
+                if id == entity_id:
+                    break
+                bot_db.add_wrong_guess(chat_id)
+                BotAkinator(theme, version, chat_id)
+                bot_db.remove_last_wrong_guess(chat_id)
+            else:
+                break
+
+            undone = BotAkinator(theme, version, chat_id).game_db.dump_state()
+            bot_db.remove_game_state(chat_id)
+            same = same_game_states(undone, BotAkinator(theme, version, chat_id).game_db.dump_state()) and same
+
+            if akinator.state == AkinatorState.AskQuestion:
+                bot_db.add_given_answer(chat_id, answers.get(id, 0.0))
+            else:
+                bot_db.add_wrong_guess(chat_id)
+
+    bot_db.clear_whole_session(chat_id, "start")
+    bot_db.close()
+    theme_db.close()
+    print(f"undone turns same as replayed games: {same}")
+    return same
+
+
+def test_bot_sessions(theme: str = "test", version: Version = Version(1, 2), chat_ids: tuple = (-1, -2, -3)) -> bool:
+    # engines of chats are reused by their next turns, the least recently used and idle ones are evicted
+    # and chats evicted continue from their saved game states
+    from BotAkinator import BotAkinator, BotSessions
+    from bot_db import BotDB
+    from sqlite3 import IntegrityError
+    from time import sleep
+
+    size_limit, idle_seconds = BotSessions.size_limit, BotSessions.idle_seconds
+    BotSessions.size_limit = len(chat_ids) - 1
+    bot_db = BotDB()
+    bot_db.create_tables()
+
+    def play_turn(chat_id: int) -> tuple:  # tuple[bytes, bytes, bytes] of game state after the turn
+        akinator = BotAkinator(theme, version, chat_id)
+        id = akinator.ask_question()[0]
+        bot_db.save_akinator_loop(chat_id, "ask_question", akinator.iteration, akinator.state, id)
+        state = akinator.game_db.dump_state()
+        akinator.release()
+        bot_db.add_given_answer(chat_id, 1.0)
+        return state
+
+    for chat_id in chat_ids:
+        try:
+            bot_db.add_user(chat_id, "start")
+        except IntegrityError:  # the user already exists
+            pass
+        bot_db.clear_game_session(chat_id, "ask_question")
+        bot_db.set_theme(chat_id, "ask_theme", theme)
+        BotSessions.discard(chat_id)
+
+    # the second turn of a chat takes its engine from the pool
+    play_turn(chat_ids[0])
+    hits = BotSessions.hits
+    play_turn(chat_ids[0])
+    reused = BotSessions.hits == hits + 1
+
+    # other chats fill the pool, the first one is evicted and its next turn loads the saved game state
+    for chat_id in chat_ids[1:]:
+        play_turn(chat_id)
+    evicted = BotSessions.session_count() == BotSessions.size_limit
+    misses = BotSessions.misses
+    akinator = BotAkinator(theme, version, chat_ids[0])
+    rehydrated = BotSessions.misses == misses + 1
+    bot_db.remove_game_state(chat_ids[0])
+    replayed = BotAkinator(theme, version, chat_ids[0])
+    rehydrated = rehydrated and same_game_states(akinator.game_db.dump_state(), replayed.game_db.dump_state())
+    del akinator, replayed
+
+    # sessions unused for longer than idle_seconds are evicted
+    BotSessions.idle_seconds = 0.05
+    sleep(2 * BotSessions.idle_seconds)
+    misses = BotSessions.misses
+    play_turn(chat_ids[-1])
+    idle = BotSessions.misses == misses + 1 and BotSessions.session_count() == 1
+
+    for chat_id in chat_ids:
+        BotSessions.discard(chat_id)
+        bot_db.clear_whole_session(chat_id, "start")
+    bot_db.close()
+    BotSessions.size_limit, BotSessions.idle_seconds = size_limit, idle_seconds
+
+    print(f"reused: {reused}, evicted: {evicted}, rehydrated: {rehydrated}, idle evicted: {idle}")
+    return reused and evicted and rehydrated and idle
+
+
 def auto_akinate(akinator: Akinator, chosen_entity_id: int) -> tuple:  # tuple[bool, int]
-    answers = akinator.db.get_answers(["question_id", "answer_value"], f"entity_id={chosen_entity_id}").fetchall()
+    parent_db = sql_connect(PathCreator.db(akinator.db.theme, akinator.db.version))
+    answers = parent_db.execute("SELECT question_id, answer_value FROM answers WHERE entity_id=?",
+                                (chosen_entity_id,)).fetchall()
+    parent_db.close()
 
     question_ids, answer_values = [a[0] for a in answers],[a[1] for a in answers]
 
@@ -230,7 +454,7 @@ def auto_akinate(akinator: Akinator, chosen_entity_id: int) -> tuple:  # tuple[b
         elif akinator.state == AkinatorState.MakeLastGuess:
             ids_and_names, count = akinator.last_guess()
 
-            for id, name, i in zip(ids_and_names, range(count if count <= 4 else 4)):
+            for (id, name), i in zip(ids_and_names, range(count if count <= 4 else 4)):
                 if id == chosen_entity_id:
                     akinator.state = AkinatorState.Victory
                     break
@@ -245,6 +469,195 @@ def auto_akinate(akinator: Akinator, chosen_entity_id: int) -> tuple:  # tuple[b
         raise RuntimeError()
 
 
+def play_games(theme: str, version: Version, entity_ids: list, algorithms=None, shards=None, clock=None,
+               games: list = None) -> tuple:
+    # tuple[float, float, float] as win rate, mean iterations of won games and CPU seconds per turn
+    # (or seconds of another clock such as wall clock seconds), games gets (success, iteration) of every game
+    from Akinator import TurnCache
+    from statistics import mean
+    from time import process_time
+
+    clock = clock or process_time
+    won_iterations, iterations, seconds = list(), 0, 0.0
+    for entity_id in entity_ids:
+        # games do not reuse turns of previous ones
+        TurnCache.invalidate(theme)
+        akinator = Akinator(theme, version, algorithms, shards)
+        begin = clock()
+        success, iteration = auto_akinate(akinator, entity_id)
+        seconds += clock() - begin
+        iterations += iteration
+        if success:
+            won_iterations.append(iteration)
+        if games is not None:
+            games.append((success, iteration))
+
+    return len(won_iterations) / len(entity_ids), mean(won_iterations) if won_iterations else None, seconds / iterations
+
+
+def print_games(title: str, results: dict, clock_name: str = "CPU"):
+    # results is dict[str, tuple[float, float, float]] as results of play_games
+    print("{:<22}{:<10}{:<16}{}".format(title, "Wins", "Iterations/win", f"{clock_name} s/turn"))
+    for name, (win_rate, won_iterations, turn_seconds) in results.items():
+        print(f"{name:<22}{win_rate:<10.3f}{won_iterations or 0.0:<16.2f}{turn_seconds:.6f}")
+
+
+def random_entity_ids(theme: str, version: Version, count: int) -> list:  # list[int]
+    from EngineClass import GameEngine
+
+    engine = GameEngine(theme, version)
+    entity_ids = engine.matrix.entity_ids.tolist()
+    engine.close()
+    return [entity_ids[randrange(len(entity_ids))] for i in range(count)]
+
+
+def compare_algorithms(theme: str = "test", version: Version = Version(1, 2), game_count: int = 50) -> dict:
+    # dict[str, tuple[float, float, float]] as results of play_games for algorithms
+    # games of test 1.4 are too sparse to be won by either of them
+    from Akinator import BayesianAlgorithms
+    from statistics import mean
+
+    chosen_ids = random_entity_ids(theme, version, game_count)
+    results, games = dict(), dict()
+    for algorithms in (AkinationAlgorithms, BayesianAlgorithms):
+        games[algorithms.__name__] = list()
+        results[algorithms.__name__] = play_games(theme, version, chosen_ids, algorithms,
+                                                  games=games[algorithms.__name__])
+    print_games("Algorithms", results)
+
+    # turns to win the same entity by both algorithms and games won in fewer turns than by the other one
+    first, second = games.values()
+    both = [(first_turns, second_turns) for (first_won, first_turns), (second_won, second_turns) in zip(first, second)
+            if first_won and second_won]
+    print(f"won by both: {len(both)}")
+    if both:
+        for i, name in enumerate(games):
+            fewer = sum(turns[i] < turns[1 - i] for turns in both)
+            print(f"{name:<22}{mean(turns[i] for turns in both):.2f} turns, {fewer} won in fewer turns")
+    return results
+
+
+def test_clusters(theme: str = "test", version: Version = Version(1, 2), game_count: int = 100,
+                  cluster_turns: int = 4) -> dict:
+    # dict[str, tuple[float, float, float]] as results of play_games without and with clusters
+    # entities of version are clustered if they are not yet (games of test 1.4 are too sparse to be won)
+    from EngineClass import ThemeMatrix
+
+    matrix = ThemeMatrix(theme, version)
+    if matrix.clusters is None:
+        server_db = Connection(Connection.Type.server, theme, version)
+        server_db.replace_entity_clusters(matrix.clustering())
+        server_db.close()
+        ThemeMatrix.replace(theme)
+
+    chosen_ids = random_entity_ids(theme, version, game_count)
+    default_turns, results = Akinator.cluster_turns, dict()
+    for turns in (0, cluster_turns):
+        Akinator.cluster_turns = turns
+        results[f"{turns} cluster turns"] = play_games(theme, version, chosen_ids)
+    Akinator.cluster_turns = default_turns
+
+    print_games("Clusters", results)
+    return results
+
+
+def test_shards(theme: str = "test", versions: tuple = (Version(1, 2), Version(1, 4)), game_count: int = 20,
+                shard_counts: tuple = (1, 2, 4)) -> int:
+    # entity count of the smallest version of versions where a shard pool of shard_counts workers plays a turn
+    # faster than one process, None if it is slower for all of them: the value for ShardPool.entity_minimum
+    # sharded games play the same as unsharded ones, only wall clock time per turn changes
+    from ShardClass import ShardPool
+    from time import perf_counter
+
+    entity_minimum, break_even = ShardPool.entity_minimum, None
+    # every pool is measured whatever its theme size
+    ShardPool.entity_minimum = 0
+    for version in versions:
+        chosen_ids = random_entity_ids(theme, version, game_count)
+        results = {"not sharded": play_games(theme, version, chosen_ids, clock=perf_counter)}
+        for shard_count in shard_counts:
+            pool = ShardPool(theme, version, shard_count)
+            results[f"{shard_count} shards"] = play_games(theme, version, chosen_ids, shards=pool,
+                                                          clock=perf_counter)
+            pool.stop()
+
+        print_games(f"Shards of {version.to_string()}", results, "Wall")
+        print("Same games:", all(result[:2] == results["not sharded"][:2] for result in results.values()))
+        if any(results[f"{shard_count} shards"][2] < results["not sharded"][2] for shard_count in shard_counts):
+            entity_count = pool.entity_count
+            break_even = entity_count if break_even is None else min(break_even, entity_count)
+    ShardPool.entity_minimum = entity_minimum
+
+    print("Break even:", f"{break_even} entities" if break_even is not None else "none")
+    return break_even
+
+
+def private_memory() -> int:
+    # kB of memory of this process not shared with others (Linux only, 0 elsewhere)
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            return sum(int(line.split()[1]) for line in smaps if line.startswith("Private_"))
+    except OSError:
+        return 0
+
+
+def warm_worker(theme: str, version: Version, results):
+    # seconds and kB of private memory to acquire a theme version and start a game in a fresh process
+    from EngineClass import GameEngine
+    from time import perf_counter
+
+    memory, begin = private_memory(), perf_counter()
+    game = GameEngine(theme, version)
+    game.question_splits(0.0)
+    results.put((perf_counter() - begin, private_memory() - memory))
+    game.close()
+
+
+def test_shared_matrices(theme: str = "test", version: Version = Version(1, 4),
+                         worker_counts: tuple = (1, 2, 4, 8)) -> dict:
+    # dict[str, tuple[float, float]] as mean seconds and kB of private memory for workers to get warm
+    # with theme version loaded by each of them and attached from shared memory
+    from EngineClass import ThemeMatrix
+    from multiprocessing import get_context
+
+    # forked workers would inherit snapshots of this process instead of loading or attaching them
+    context = get_context("spawn")
+    results = dict()
+    for shared in (False, True):
+        if shared:
+            ThemeMatrix.publish(theme, version)
+        for worker_count in worker_counts:
+            queue = context.Queue()
+            workers = [context.Process(target=warm_worker, args=(theme, version, queue)) for i in range(worker_count)]
+            for worker in workers:
+                worker.start()
+            warm = [queue.get() for worker in workers]
+            for worker in workers:
+                worker.join()
+            results[f"{worker_count} {'attaching' if shared else 'loading'}"] = \
+                (sum(seconds for seconds, memory in warm) / worker_count, sum(memory for seconds, memory in warm))
+    ThemeMatrix.unpublish(theme)
+
+    print("{:<22}{:<16}{}".format("Workers", "Warm s/worker", "Private kB total"))
+    for name, (seconds, memory) in results.items():
+        print(f"{name:<22}{seconds:<16.6f}{memory}")
+    return results
+
+
+def test_matrix_memory(theme: str = "test", version: Version = Version(1, 4)) -> dict:
+    # dict[str, int] as bytes of arrays of theme version snapshot, per answer arrays first
+    from EngineClass import ThemeMatrix
+
+    matrix = ThemeMatrix(theme, version)
+    sizes = {name: array.nbytes for name, array in matrix.__arrays__()}
+    answer_bytes = sum(array.nbytes for name, array in matrix.__arrays__() if len(array) == matrix.answer_count())
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        print(f"{name:<26}{size}")
+    print(f"{matrix.answer_count()} answers, {answer_bytes / max(matrix.answer_count(), 1):.1f} bytes per answer, "
+          f"{sum(sizes.values())} bytes in total")
+    return sizes
+
+
 def auto_test_akinator(count: int) -> tuple:  # tuple[float, list]
     disk_db = DataGenerator.generate_tables("test", Version(1, 4), use_memory=False, entity_count=250,
                                             entity_to_question_ratio = 0.5, answer_count_bounds = (7, 14))
@@ -259,7 +672,7 @@ def auto_test_akinator(count: int) -> tuple:  # tuple[float, list]
     success_list = list()
 
     for i in range(count):
-        akinator = Akinator(disk_db.theme, disk_db.version, Connection.Type.game)
+        akinator = Akinator(disk_db.theme, disk_db.version)
         entity_id = entities[randint(0, len(entities) - 1)][0]
         success, iteration = auto_akinate(akinator, entity_id)
         if success:
@@ -1,4 +1,7 @@
 from ConnectionClass import Connection
+from EngineClass import ThemeMatrix
+from Akinator import Akinator, OpeningBook, TurnCache
+from BotAkinator import BotAkinator, BotSessions
 from file_management import PathCreator
 from theme_db import ThemeDB
 from VersionClass import Version
@@ -184,6 +187,26 @@ def apply_update(new_data: dict):
 
         #server_db.update_answers(new_data[theme]["mod_answers"])
 
+        # question stats start splits of every game, questions answered alike: asking one lowers the rank of others
+        matrix = ThemeMatrix(theme, latest_version(theme))
+        server_db.replace_question_stats(matrix.question_stats())
+        server_db.replace_question_partners(matrix.question_partners())
+        # games of large themes start over clusters of entities when games descend into clusters
+        clusters = matrix.clustering() \
+            if Akinator.cluster_turns and matrix.entity_count() >= ThemeMatrix.cluster_entity_minimum else list()
+        server_db.replace_entity_clusters(clusters)
         server_db.close()
+        # games map compiled arrays of the version instead of loading it with SQL
+        ThemeMatrix.write_compiled(theme, latest_version(theme))
+        # games already running keep their snapshot of the previous version
+        ThemeMatrix.replace(theme)
+        # a loader publishing theme to shared memory publishes the new version instead of older ones
+        if ThemeMatrix.published(theme):
+            ThemeMatrix.unpublish(theme)
+            ThemeMatrix.publish(theme, latest_version(theme))
+        TurnCache.invalidate(theme)
+        # games of theme are replayed over the new version, engines of the previous one are not needed
+        BotSessions.invalidate(theme)
+        OpeningBook.build(theme, latest_version(theme), [Akinator, BotAkinator]).save(theme, latest_version(theme))
 
     theme_db.close()